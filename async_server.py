@@ -0,0 +1,197 @@
+"""
+Asyncio ingest server (aiohttp + aiomysql) exposing the same contract as main.py:
+
+  POST /api/v1/sensor          single reading (JSON or binary record)
+  POST /api/v1/sensor/batch    JSON array / NDJSON / concatenated binary records
+  GET  /api/v1/sensor/latest   ?device_id=&limit=
+
+Validation is shared with the Flask app through ingest.py, so both servers
+accept exactly the same payloads. With DB_SHARDS set, each device's rows go to
+the shard db.get_shard_router() places it on, one aiomysql pool per shard.
+Run with:
+
+  python async_server.py          # PORT env var, default 5001
+"""
+import os
+import heapq
+import asyncio
+from itertools import islice
+
+from aiohttp import web
+import aiomysql
+
+import rollups
+from db import DB_CONFIG, INSERT_SQL, READING_COLUMNS, ShardWriteError, get_shard_router
+from ingest import (parse_reading, parse_batch_body, validate_batch, decode_binary_batch,
+                    get_dedup_cache, BINARY_CONTENT_TYPE)
+
+LATEST_SQL = f"SELECT {READING_COLUMNS} FROM sensor_readings ORDER BY ts DESC LIMIT %s"
+LATEST_DEVICE_SQL = f"SELECT {READING_COLUMNS} FROM sensor_readings WHERE device_id=%s ORDER BY ts DESC LIMIT %s"
+
+
+def shard_for(app, device_id):
+    router = app['router']
+    return router.shard_for(device_id) if router is not None else 'primary'
+
+
+async def insert_rows(app, rows):
+    """Insert each shard's share of the rows concurrently; ShardWriteError lists the rows that failed."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(shard_for(app, row[0]), []).append(row)
+    pools = app['pools']
+    if len(groups) == 1:
+        name, group = groups.popitem()
+        return await insert_shard(pools[name], group)
+    results = await asyncio.gather(*(insert_shard(pools[name], group) for name, group in groups.items()),
+                                   return_exceptions=True)
+    errors = {}
+    failed_rows = []
+    for (name, group), result in zip(groups.items(), results):
+        if isinstance(result, Exception):
+            errors[name] = result
+            failed_rows.extend(group)
+    if errors:
+        raise ShardWriteError(errors, failed_rows, len(rows) - len(failed_rows))
+
+
+async def insert_shard(pool, rows):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.executemany(INSERT_SQL, rows)
+            if rollups.enabled() and cursor.rowcount < len(rows):
+                # INSERT IGNORE skipped retransmits: rebuild their buckets rather than merge them twice
+                for sql, params in rollups.rebuild_statements(rollups.spans(rows)):
+                    await cursor.execute(sql, params)
+            elif rollups.enabled():
+                for granularity, table in rollups.GRANULARITIES.items():
+                    await cursor.executemany(rollups.UPSERT_SQL.format(table=table),
+                                             rollups.aggregate(rows, granularity))
+        await conn.commit()
+
+
+async def ingest_sensor(request):
+    try:
+        if request.content_type == BINARY_CONTENT_TYPE:
+            rows, results = decode_binary_batch(await request.read())
+            if len(results) != 1:
+                raise ValueError("Expected exactly one binary record")
+            if not rows:
+                raise ValueError(results[0]['error'])
+        else:
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            rows = [parse_reading(data)]
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+    dedup = get_dedup_cache()
+    if dedup is not None and not dedup.filter(rows):
+        return web.json_response({"status": "duplicate"}, status=201)
+
+    try:
+        await insert_rows(request.app, rows)
+    except Exception as e:
+        if dedup is not None:
+            dedup.forget(rows)
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response({"status": "ok"}, status=201)
+
+
+async def ingest_sensor_batch(request):
+    try:
+        body = await request.read()
+        if request.content_type == BINARY_CONTENT_TYPE:
+            rows, results = decode_binary_batch(body)
+        else:
+            rows, results = validate_batch(parse_batch_body(body))
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+    dedup = get_dedup_cache()
+    if dedup is not None:
+        rows = dedup.filter(rows, results)
+
+    statuses = [r['status'] for r in results]
+    response = {"accepted": statuses.count('accepted'), "duplicates": statuses.count('duplicate'),
+                "rejected": statuses.count('rejected'), "results": results}
+    if not rows:
+        return web.json_response(response, status=201 if response['duplicates'] else 400)
+    try:
+        await insert_rows(request.app, rows)
+    except Exception as e:
+        if dedup is not None:
+            # Rows committed on healthy shards stay remembered, so a client retry is acknowledged as duplicates
+            dedup.forget(getattr(e, 'failed_rows', rows))
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response(response, status=201)
+
+
+async def fetch_latest(pool, sql, params):
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+
+async def latest(request):
+    device_id = request.query.get('device_id')
+    limit = int(request.query.get('limit') or 10)
+    try:
+        if device_id:
+            rows = await fetch_latest(request.app['pools'][shard_for(request.app, device_id)], LATEST_DEVICE_SQL, (device_id, limit))
+        else:
+            # Every shard answers newest-first, so a k-way merge of the heads is enough
+            per_shard = await asyncio.gather(*(fetch_latest(pool, LATEST_SQL, (limit,))
+                                               for pool in request.app['pools'].values()))
+            rows = list(islice(heapq.merge(*per_shard, key=lambda r: r['ts'], reverse=True), limit))
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    for row in rows:
+        if row.get('ts') is not None:
+            row['ts'] = row['ts'].strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return web.json_response(rows)
+
+
+async def open_pool(app):
+    router = get_shard_router()
+    configs = {name: pool.config for name, pool in router.pools.items()} if router else {'primary': DB_CONFIG}
+    app['router'] = router
+    app['pools'] = {}
+    for name, config in configs.items():
+        app['pools'][name] = await aiomysql.create_pool(
+            host=config['host'],
+            port=config['port'],
+            user=config['user'],
+            password=config['password'],
+            db=config['database'],
+            minsize=int(os.environ.get('ASYNC_DB_POOL_MIN', 2)),
+            maxsize=int(os.environ.get('ASYNC_DB_POOL_MAX', 20)),
+        )
+
+
+async def close_pool(app):
+    for pool in app['pools'].values():
+        pool.close()
+    for pool in app['pools'].values():
+        await pool.wait_closed()
+
+
+def create_app():
+    app = web.Application(client_max_size=int(os.environ.get('ASYNC_MAX_BODY_MB', 8)) * 1024 * 1024)
+    app.router.add_post('/api/v1/sensor', ingest_sensor)
+    app.router.add_post('/api/v1/sensor/batch', ingest_sensor_batch)
+    app.router.add_get('/api/v1/sensor/latest', latest)
+    app.on_startup.append(open_pool)
+    app.on_cleanup.append(close_pool)
+    return app
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5001))
+    # keepalive_timeout keeps idle device connections open instead of re-handshaking per reading
+    web.run_app(create_app(), host='0.0.0.0', port=port,
+                keepalive_timeout=float(os.environ.get('ASYNC_KEEPALIVE_S', 75)),
+                backlog=int(os.environ.get('ASYNC_BACKLOG', 2048)))
@@ -0,0 +1,56 @@
+"""
+Benchmark: JSON vs packed binary decoding of sensor readings.
+
+Usage:
+  python bench_decode.py            # 100k readings
+  python bench_decode.py 500000
+"""
+import sys
+import json
+import time
+
+from ingest import parse_reading, parse_batch_body, validate_batch, decode_binary_batch, encode_binary
+
+
+def make_readings(n):
+    base = 1760000000
+    return [("esp%02d" % (i % 50), 200 + i % 800, i % 2, int(i % 10 == 0), base + i) for i in range(n)]
+
+
+def bench(label, fn, payload, n, size, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(payload)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<28} {size:>12,} bytes  {best * 1000:>9.1f} ms  {n / best:>12,.0f} readings/s")
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    readings = make_readings(n)
+
+    json_lines = [
+        json.dumps({"device_id": d, "ldr": l, "water": w, "buzzer": b,
+                    "ts": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))})
+        for d, l, w, b, ts in readings
+    ]
+    ndjson = '\n'.join(json_lines).encode('utf-8')
+    binary = b''.join(encode_binary(*r) for r in readings)
+
+    print("=" * 72)
+    print(f"Decode benchmark: {n:,} readings")
+    print("=" * 72)
+    t_single = bench("JSON, one request each", lambda p: [parse_reading(json.loads(x)) for x in p], json_lines, n, sum(len(x) for x in json_lines))
+    t_ndjson = bench("NDJSON batch", lambda p: validate_batch(parse_batch_body(p)), ndjson, n, len(ndjson))
+    t_binary = bench("binary batch", decode_binary_batch, binary, n, len(binary))
+    print("-" * 72)
+    print(f"  binary vs JSON single: {t_single / t_binary:.1f}x faster")
+    print(f"  binary vs NDJSON:      {t_ndjson / t_binary:.1f}x faster, "
+          f"{len(ndjson) / len(binary):.1f}x smaller")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Parsed, indexed copy of sensorWater.csv for /api/v1/csv.
+
+The file is parsed once into a list of row dicts plus a Status -> rows index,
+and re-parsed only when its (mtime, size) signature changes, so a request is a
+dictionary lookup and a slice.
+"""
+import os
+import csv
+import threading
+
+
+def _parse(path):
+    rows = []
+    by_status = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for r in csv.DictReader(f, delimiter=';'):
+            # normalize/convert types
+            try:
+                r['Time(s)'] = int(r.get('Time(s)', '') or 0)
+            except Exception:
+                r['Time(s)'] = None
+            try:
+                r['WaterLevel'] = int(r.get('WaterLevel', '') or 0)
+            except Exception:
+                r['WaterLevel'] = None
+            # keep other fields as-is
+            rows.append(r)
+            by_status.setdefault(r.get('Status'), []).append(r)
+    return rows, by_status
+
+
+class CsvCache:
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._rows = []
+        self._by_status = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _current(self):
+        st = os.stat(self.path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if signature != self._signature:
+                self._rows, self._by_status = _parse(self.path)
+                self._signature = signature
+                self.loads += 1
+            return self._rows, self._by_status
+
+    def query(self, status=None, limit=1000):
+        """First `limit` rows in file order, optionally only those with the given Status."""
+        rows, by_status = self._current()
+        if status:
+            rows = by_status.get(status, [])
+        return rows[:limit]
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_csv_cache(path):
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = CsvCache(path)
+        return _caches[path]
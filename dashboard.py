@@ -9,7 +9,7 @@ from pathlib import Path
 
 # Database integration (optional - if DB is configured)
 try:
-    from db import get_db, fetch_latest_readings
+    from db import get_read_db, get_shard_router, iter_latest_readings
     DB_AVAILABLE = True
 except Exception:
     DB_AVAILABLE = False
@@ -92,10 +92,18 @@ def load_db_data(limit=1000):
         return pd.DataFrame()
     
     try:
-        conn = get_db()
-        rows = fetch_latest_readings(conn, limit=limit)
-        if rows:
-            df = pd.DataFrame(rows)
+        router = get_shard_router()
+        if router is not None:
+            # Fleet-wide newest rows have to be merged across shards
+            rows = router.fetch_latest(limit=limit)
+            chunks = [pd.DataFrame.from_records(rows)] if rows else []
+        else:
+            # Analytic reads go to a replica when DB_REPLICAS is configured
+            conn = get_read_db()
+            # Build the frame chunk by chunk instead of materializing every row as a dict first
+            chunks = [pd.DataFrame.from_records(rows) for rows in iter_latest_readings(conn, limit=limit)]
+        if chunks:
+            df = pd.concat(chunks, ignore_index=True)
             # Rename columns to match CSV format
             df = df.rename(columns={
                 'ldr': 'LDR',
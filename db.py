@@ -1,5 +1,19 @@
 import os
+import json
+import time
+import heapq
+import queue
+import bisect
+import hashlib
+import atexit
+import signal
+import sqlite3
+import threading
 from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+import rollups
 
 try:
     from dotenv import load_dotenv
@@ -8,12 +22,19 @@ except Exception:
 
     pass
 
+# 'mysql' (default) or 'sqlite' for an embedded database file (see sqlite_backend.py)
+BACKEND = os.environ.get('DB_BACKEND', 'mysql').lower()
+
 try:
     import mysql.connector
-    from mysql.connector import pooling
+    from mysql.connector import errors
 except Exception as e:
+    if BACKEND != 'sqlite':
+        raise ImportError("mysql-connector-python is required. Install with 'pip install mysql-connector-python'") from e
+    mysql = errors = None
 
-    raise ImportError("mysql-connector-python is required. Install with 'pip install mysql-connector-python'") from e
+if BACKEND == 'sqlite':
+    import sqlite_backend
 
 DB_CONFIG = {
     'host': os.environ.get('DB_HOST', '127.0.0.1'),
@@ -23,24 +44,466 @@ DB_CONFIG = {
     'port': int(os.environ.get('DB_PORT', 3306)),
 }
 
+class PooledConnection:
+    """Proxy around a pooled connection; close() hands it back to the pool."""
+
+    def __init__(self, pool, conn, created):
+        self._pool = pool
+        self._conn = conn
+        self.created = created
+        self.returned = time.monotonic()
+        self.checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None and self.checked_out:
+            self.checked_out = False
+            self._pool._release(self)
+
+
+class ConnectionPool:
+    """Elastic MySQL connection pool with bounded waiting and usage metrics.
+
+    Keeps at least `min_size` and at most `max_size` connections. When all are
+    in use, get_connection() waits up to `timeout` seconds before raising
+    PoolError. Connections older than `recycle` seconds are replaced, idle ones
+    are pinged before reuse after `ping_after` seconds, and surplus idle
+    connections above `min_size` are closed after `idle_timeout` seconds.
+    """
+
+    def __init__(self, min_size=1, max_size=5, timeout=2.0, recycle=3600,
+                 ping_after=30, idle_timeout=300, **config):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.idle_timeout = idle_timeout
+        self.config = config
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'checkouts': 0, 'created': 0, 'recycled': 0, 'broken': 0,
+                      'exhausted': 0, 'wait_total_ms': 0.0, 'wait_max_ms': 0.0}
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        try:
+            conn = PooledConnection(self, mysql.connector.connect(**self.config), time.monotonic())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn._conn.close()
+        except Exception:
+            pass
+        conn._conn = None
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _healthy(self, conn):
+        now = time.monotonic()
+        if self.recycle and now - conn.created > self.recycle:
+            self.stats['recycled'] += 1
+            return False
+        if now - conn.returned > self.ping_after:
+            try:
+                conn._conn.ping(reconnect=False)
+            except Exception:
+                self.stats['broken'] += 1
+                return False
+        return True
+
+    def get_connection(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['exhausted'] += 1
+                        raise errors.PoolError(
+                            f"Connection pool exhausted: {self._in_use}/{self.max_size} in use after {timeout:.1f}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+            if create:
+                conn = self._connect()
+            elif not self._healthy(conn):
+                self._discard(conn)
+                continue
+            conn.checked_out = True
+            waited = (time.monotonic() - started) * 1000
+            with self._cond:
+                self._in_use += 1
+                self.stats['checkouts'] += 1
+                self.stats['wait_total_ms'] += waited
+                self.stats['wait_max_ms'] = max(self.stats['wait_max_ms'], waited)
+            return conn
+
+    def _release(self, conn):
+        try:
+            if conn._conn.in_transaction:
+                conn._conn.rollback()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+            self.stats['broken'] += 1
+            self._discard(conn)
+            return
+        now = time.monotonic()
+        conn.returned = now
+        with self._cond:
+            self._in_use -= 1
+            # Shrink back towards min_size by dropping connections that sat idle too long
+            stale = [c for c in self._idle if now - c.returned > self.idle_timeout]
+            surplus = max(0, self._size - self.min_size)
+            stale = stale[:surplus]
+            for c in stale:
+                self._idle.remove(c)
+            self._idle.append(conn)
+            self._cond.notify()
+        for c in stale:
+            self._discard(c)
+
+    def info(self):
+        with self._cond:
+            checkouts = self.stats['checkouts']
+            return dict(self.stats,
+                        wait_avg_ms=round(self.stats['wait_total_ms'] / checkouts, 3) if checkouts else 0.0,
+                        size=self._size, in_use=self._in_use, idle=len(self._idle),
+                        min_size=self.min_size, max_size=self.max_size)
+
+
 pool = None
+_pool_lock = threading.Lock()
 
 def init_pool():
     global pool
-    if pool is None:
-        pool = pooling.MySQLConnectionPool(pool_name="mypool",
-                                           pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
-                                           **DB_CONFIG)
+    if BACKEND == 'sqlite':
+        return
+    with _pool_lock:
+        if pool is None:
+            pool = ConnectionPool(
+                min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+                max_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+                timeout=int(os.environ.get('DB_POOL_TIMEOUT_MS', 2000)) / 1000.0,
+                recycle=int(os.environ.get('DB_POOL_RECYCLE_S', 3600)),
+                **DB_CONFIG)
 
 def get_db():
     """Return a connection from pool. Caller should close the connection when done."""
+    if BACKEND == 'sqlite':
+        return sqlite_backend.connect()
     if pool is None:
         init_pool()
     return pool.get_connection()
 
+def replica_safe(func):
+    """Mark a read helper as safe to run on a replica connection from get_read_db()."""
+    func.replica_safe = True
+    return func
+
+
+class ReadRouter:
+    """Routes replica-safe reads across replica pools, falling back to the primary.
+
+    `routing` is 'round_robin' or 'least_loaded' (fewest connections in use).
+    A replica whose replication lag exceeds `max_lag` seconds, or whose lag
+    cannot be determined, is skipped; lag is re-checked at most every
+    `check_interval` seconds per replica.
+    """
+
+    def __init__(self, replicas, routing='round_robin', max_lag=5.0, check_interval=5.0):
+        self.replicas = replicas
+        self.routing = routing
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._lag = {}  # index -> (checked_at, lag or None)
+        self._lock = threading.Lock()
+        self.stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'lag_skips': 0}
+
+    def _replica_lag(self, index):
+        now = time.monotonic()
+        checked = self._lag.get(index)
+        if checked and now - checked[0] < self.check_interval:
+            return checked[1]
+        lag = None
+        try:
+            conn = self.replicas[index].get_connection(timeout=0.5)
+            cursor = conn.cursor(dictionary=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except Exception:
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                if status is None:
+                    lag = 0  # not replicating: a static read-only copy
+                else:
+                    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+            finally:
+                cursor.close()
+                conn.close()
+        except Exception:
+            lag = None
+        self._lag[index] = (now, lag)
+        return lag
+
+    def _candidates(self):
+        with self._lock:
+            order = list(range(len(self.replicas)))
+            if self.routing == 'least_loaded':
+                order.sort(key=lambda i: self.replicas[i].info()['in_use'])
+            else:
+                start = self._next
+                self._next = (self._next + 1) % len(self.replicas)
+                order = order[start:] + order[:start]
+            return order
+
+    def get_connection(self):
+        for index in self._candidates():
+            lag = self._replica_lag(index)
+            if lag is None or lag > self.max_lag:
+                self.stats['lag_skips'] += 1
+                continue
+            try:
+                conn = self.replicas[index].get_connection()
+            except Exception:
+                continue
+            self.stats['replica_reads'] += 1
+            return conn
+        self.stats['primary_fallbacks'] += 1
+        return get_db()
+
+    def info(self):
+        return dict(self.stats, replicas=len(self.replicas),
+                    lag={i: lag for i, (_, lag) in self._lag.items()})
+
+
+read_router = None
+_read_router_lock = threading.Lock()
+
+def get_read_db():
+    """Connection for a replica_safe read: a healthy replica from DB_REPLICAS, else the primary."""
+    global read_router
+    replicas = os.environ.get('DB_REPLICAS', '').strip()
+    if not replicas:
+        return get_db()
+    with _read_router_lock:
+        if read_router is None:
+            pools = []
+            for entry in replicas.split(','):
+                host, _, port = entry.strip().partition(':')
+                config = dict(DB_CONFIG, host=host, port=int(port or DB_CONFIG['port']))
+                # min_size=0: a replica that is down at startup must not stop the app
+                pools.append(ConnectionPool(min_size=0,
+                                            max_size=int(os.environ.get('DB_REPLICA_POOL_SIZE', 5)),
+                                            timeout=int(os.environ.get('DB_POOL_TIMEOUT_MS', 2000)) / 1000.0,
+                                            **config))
+            read_router = ReadRouter(
+                pools,
+                routing=os.environ.get('DB_READ_ROUTING', 'round_robin'),
+                max_lag=float(os.environ.get('DB_REPLICA_MAX_LAG_S', 5)),
+                check_interval=float(os.environ.get('DB_REPLICA_LAG_CHECK_S', 5)),
+            )
+    return read_router.get_connection()
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring: adding or removing a node only remaps ~1/N of the keys."""
+
+    def __init__(self, nodes, vnodes=128):
+        self._points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._keys = [p for p, _ in self._points]
+
+    def node_for(self, key):
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._points[i][1]
+
+
+def parse_shards(spec):
+    """'s0=host:port/db,s1=host:port/db' -> {name: connection config}; names default to s0, s1, ..."""
+    shards = {}
+    for i, entry in enumerate(e.strip() for e in spec.split(',') if e.strip()):
+        name, _, target = entry.rpartition('=')
+        address, _, database = target.partition('/')
+        host, _, port = address.partition(':')
+        shards[name or f"s{i}"] = dict(DB_CONFIG, host=host, port=int(port or DB_CONFIG['port']),
+                                       database=database or DB_CONFIG['database'])
+    return shards
+
+
+class ShardWriteError(Exception):
+    """Some shards failed an insert that others committed.
+
+    `failed_rows` are the rows of the failed shards only: retrying or spooling
+    the whole batch would insert the committed shards' rows twice.
+    """
+
+    def __init__(self, errors, failed_rows, inserted):
+        super().__init__("insert failed on shard(s) " +
+                         ", ".join(f"{name}: {error}" for name, error in sorted(errors.items())))
+        self.errors = errors
+        self.failed_rows = failed_rows
+        self.inserted = inserted
+
+
+def is_unavailable(error):
+    """True if `error` means the database could not be reached, not that it rejected the rows.
+
+    Only these are worth spooling and retrying later; a DataError or
+    IntegrityError fails the same way on every attempt. A ShardWriteError
+    counts as unavailable if any of its shards was.
+    """
+    if isinstance(error, ShardWriteError):
+        return any(is_unavailable(e) for e in error.errors.values())
+    if errors is not None:
+        return isinstance(error, (errors.OperationalError, errors.InterfaceError, errors.PoolError))
+    return isinstance(error, sqlite3.OperationalError)
+
+
+class ShardRouter:
+    """Maps each device_id to one shard and fans fleet-wide reads out to all of them.
+
+    Placement is the consistent-hash owner of the device_id among the shard
+    names, unless `overrides` (written by reshard.py --move) pins the device
+    elsewhere. Shard names, not positions, are hashed, so keep them stable.
+    """
+
+    def __init__(self, shards, overrides=None, pool_size=5, timeout=2.0):
+        self.names = sorted(shards)
+        self.pools = {name: ConnectionPool(min_size=0, max_size=pool_size, timeout=timeout, **config)
+                      for name, config in shards.items()}
+        self.ring = HashRing(self.names)
+        self.overrides = overrides or {}
+        self._executor = ThreadPoolExecutor(max_workers=len(self.names), thread_name_prefix='shard')
+
+    def shard_for(self, device_id):
+        return self.overrides.get(device_id) or self.ring.node_for(device_id)
+
+    def connection(self, name):
+        return self.pools[name].get_connection()
+
+    def connection_for(self, device_id):
+        return self.connection(self.shard_for(device_id))
+
+    def insert(self, rows):
+        """Write each shard's share of the rows with one multi-row insert, all shards concurrently.
+
+        Each shard commits on its own; if any fail, ShardWriteError carries just their rows.
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.shard_for(row[0]), []).append(row)
+        futures = {name: self._executor.submit(lambda n=name, g=group: insert_readings(self.connection(n), g))
+                   for name, group in groups.items()}
+        inserted = 0
+        errors = {}
+        failed_rows = []
+        for name, future in futures.items():
+            try:
+                inserted += future.result()
+            except Exception as e:
+                errors[name] = e
+                failed_rows.extend(groups[name])
+        if errors:
+            raise ShardWriteError(errors, failed_rows, inserted)
+        return inserted
+
+    def scatter(self, fetch, *args, **kwargs):
+        """Run `fetch(conn, *args, **kwargs)` on every shard concurrently; returns the per-shard results."""
+        futures = [self._executor.submit(lambda n=name: fetch(self.connection(n), *args, **kwargs))
+                   for name in self.names]
+        return [f.result() for f in futures]
+
+    def fetch_latest(self, device_id=None, limit=10):
+        if device_id:
+            return fetch_latest_readings(self.connection_for(device_id), device_id=device_id, limit=limit)
+        # Every shard answers newest-first, so a k-way merge of the heads is enough
+        merged = heapq.merge(*self.scatter(fetch_latest_readings, limit=limit), key=lambda r: r['ts'], reverse=True)
+        return list(islice(merged, limit))
+
+    def info(self):
+        return {'shards': {name: pool.info() for name, pool in self.pools.items()},
+                'overrides': len(self.overrides)}
+
+
+shard_router = None
+_shard_router_lock = threading.Lock()
+
+def get_shard_router():
+    """Return the shared ShardRouter, or None unless DB_SHARDS is configured."""
+    global shard_router
+    spec = os.environ.get('DB_SHARDS', '').strip()
+    if not spec:
+        return None
+    with _shard_router_lock:
+        if shard_router is None:
+            overrides = {}
+            overrides_file = os.environ.get('DB_SHARD_OVERRIDES', 'shard_overrides.json')
+            if os.path.exists(overrides_file):
+                with open(overrides_file) as f:
+                    overrides = json.load(f)
+            shard_router = ShardRouter(
+                parse_shards(spec),
+                overrides=overrides,
+                pool_size=int(os.environ.get('DB_SHARD_POOL_SIZE', 5)),
+                timeout=int(os.environ.get('DB_POOL_TIMEOUT_MS', 2000)) / 1000.0,
+            )
+        return shard_router
+
+def get_device_db(device_id):
+    """Connection to the database holding device_id's rows: its shard when DB_SHARDS is set, else the primary."""
+    router = get_shard_router()
+    return router.connection_for(device_id) if router is not None else get_db()
+
+def databases():
+    """{name: connect function} for every database holding readings: each shard, or just the primary."""
+    router = get_shard_router()
+    if router is None:
+        return {'primary': get_db}
+    return {name: (lambda n=name: router.connection(n)) for name in router.names}
+
+def write_readings(rows):
+    """Insert rows on the primary, or on their owning shards when DB_SHARDS is set.
+
+    A failure on the primary leaves nothing written; with shards, ShardWriteError
+    lists the rows that were not.
+    """
+    router = get_shard_router()
+    if router is not None:
+        return router.insert(rows)
+    return insert_readings(get_db(), rows)
+
 def insert_reading(conn, device_id, ldr, water, buzzer, ts=None):
     if ts is None:
-        ts = datetime.utcnow()
+        ts = datetime.utcnow().replace(microsecond=0)
     cursor = conn.cursor()
     try:
         cursor.execute(
@@ -50,22 +513,52 @@ def insert_reading(conn, device_id, ldr, water, buzzer, ts=None):
             """,
             (device_id, ldr, water, buzzer, ts)
         )
+        if rollups.enabled():
+            rollups.apply(cursor, [(device_id, ldr, water, buzzer, ts)], inserted=cursor.rowcount)
         conn.commit()
     finally:
         cursor.close()
         conn.close()
 
+# With the optional uq_device_ts unique key from models.sql, set DB_INSERT_IGNORE=1 so
+# retransmitted readings are skipped by MySQL instead of failing the whole batch.
+INSERT_SQL = """
+    INSERT {ignore}INTO sensor_readings (device_id, ldr, water, buzzer, ts)
+    VALUES (%s, %s, %s, %s, %s)
+""".format(ignore='IGNORE ' if os.environ.get('DB_INSERT_IGNORE', '0').lower() in ('1', 'true', 'yes') else '')
+
+def insert_readings(conn, rows):
+    """Insert many (device_id, ldr, water, buzzer, ts) tuples with one executemany and one commit."""
+    if not rows:
+        conn.close()
+        return 0
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(INSERT_SQL, rows)
+        if rollups.enabled():
+            rollups.apply(cursor, rows, inserted=cursor.rowcount)
+        conn.commit()
+        return len(rows)
+    finally:
+        cursor.close()
+        conn.close()
+
+# Columns of a reading as served by /latest and /history; the row id stays internal
+# (in-memory tiers have none), history pages are addressed with next_cursor instead
+READING_COLUMNS = "device_id, ldr, water, buzzer, ts"
+
+@replica_safe
 def fetch_latest_readings(conn, device_id=None, limit=10):
     cursor = conn.cursor(dictionary=True)
     try:
         if device_id:
             cursor.execute(
-                "SELECT * FROM sensor_readings WHERE device_id=%s ORDER BY ts DESC LIMIT %s",
+                f"SELECT {READING_COLUMNS} FROM sensor_readings WHERE device_id=%s ORDER BY ts DESC LIMIT %s",
                 (device_id, limit)
             )
         else:
             cursor.execute(
-                "SELECT * FROM sensor_readings ORDER BY ts DESC LIMIT %s",
+                f"SELECT {READING_COLUMNS} FROM sensor_readings ORDER BY ts DESC LIMIT %s",
                 (limit,)
             )
         rows = cursor.fetchall()
@@ -73,3 +566,275 @@ def fetch_latest_readings(conn, device_id=None, limit=10):
     finally:
         cursor.close()
         conn.close()
+
+@replica_safe
+def fetch_history(conn, device_id, since=None, until=None, after=None, limit=500):
+    """One page of a device's readings in (ts, id) order, oldest first.
+
+    `after` is the (ts, id) of the last row of the previous page. The WHERE
+    clause keeps device_id as an equality and ts as a range so the scan is a
+    single range on idx_device_ts (InnoDB appends the primary key `id` to the
+    index, which also serves the ORDER BY). Page cost therefore does not grow
+    with how deep into the history the cursor is.
+    """
+    clauses = ["device_id = %s"]
+    params = [device_id]
+    if since is not None:
+        clauses.append("ts >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < %s")
+        params.append(until)
+    if after is not None:
+        after_ts, after_id = after
+        clauses.append("ts >= %s AND (ts > %s OR id > %s)")
+        params.extend([after_ts, after_ts, after_id])
+    params.append(limit)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT * FROM sensor_readings WHERE " + " AND ".join(clauses) +
+            " ORDER BY ts, id LIMIT %s",
+            tuple(params)
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+@replica_safe
+def fetch_rollups(conn, granularity, device_id=None, since=None, until=None):
+    """Rollup rows ('minute' or 'hour') ordered by bucket, with avg_ldr computed."""
+    table = rollups.GRANULARITIES[granularity]
+    clauses = []
+    params = []
+    if device_id:
+        clauses.append("device_id = %s")
+        params.append(device_id)
+    if since is not None:
+        clauses.append("bucket >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("bucket < %s")
+        params.append(until)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            f"SELECT *, ldr_sum / NULLIF(ldr_count, 0) AS avg_ldr FROM {table} {where} ORDER BY bucket, device_id",
+            tuple(params)
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+@replica_safe
+def fetch_window_stats(conn, device_id, since=None, until=None):
+    """Reading count, LDR avg/min/max, water/buzzer-on counts and first/last ts for one device."""
+    clauses = ["device_id = %s"]
+    params = [device_id]
+    if since is not None:
+        clauses.append("ts >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < %s")
+        params.append(until)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) AS cnt, COUNT(ldr) AS ldr_count, AVG(ldr) AS avg_ldr, MIN(ldr) AS ldr_min, "
+            "MAX(ldr) AS ldr_max, COALESCE(SUM(water = 1), 0) AS water_on, COALESCE(SUM(buzzer = 1), 0) AS buzzer_on, "
+            "MIN(ts) AS first_ts, MAX(ts) AS last_ts FROM sensor_readings WHERE " + " AND ".join(clauses),
+            tuple(params)
+        )
+        return dict(cursor.fetchone(), device_id=device_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+@replica_safe
+def iter_latest_readings(conn, device_id=None, limit=10, chunk_size=500):
+    """Stream the same rows as fetch_latest_readings in lists of up to `chunk_size`.
+
+    Uses an unbuffered cursor so only one chunk is held in memory at a time,
+    whatever the limit. The connection is closed when the generator finishes
+    or is closed early.
+    """
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    exhausted = False
+    try:
+        if device_id:
+            cursor.execute(
+                f"SELECT {READING_COLUMNS} FROM sensor_readings WHERE device_id=%s ORDER BY ts DESC LIMIT %s",
+                (device_id, limit)
+            )
+        else:
+            cursor.execute(
+                f"SELECT {READING_COLUMNS} FROM sensor_readings ORDER BY ts DESC LIMIT %s",
+                (limit,)
+            )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                exhausted = True
+                break
+            yield rows
+    finally:
+        if not exhausted:
+            try:
+                # Discard the unread remainder so the connection can go back to the pool
+                conn.consume_results()
+            except Exception:
+                pass
+        cursor.close()
+        conn.close()
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def exit_on_sigterm():
+    """Turn SIGTERM (kill, docker stop, systemd) into SystemExit so atexit hooks still run.
+
+    Only replaces the default handler, and only from the main thread: servers
+    such as gunicorn install their own and exit cleanly on it.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+
+
+class WriteBehindBuffer:
+    """Bounded in-process queue drained into multi-row INSERTs by a background thread.
+
+    A flush happens when `batch_size` readings are waiting or the oldest queued
+    reading has waited `max_latency` seconds, whichever comes first. When the
+    queue is full, `on_full='reject'` fails fast and `on_full='block'` waits up
+    to `block_timeout` seconds for room. Whatever is still queued is flushed at
+    exit, including on SIGTERM (see exit_on_sigterm).
+    """
+
+    def __init__(self, batch_size=500, max_latency=0.2, max_queue=10000,
+                 on_full='reject', block_timeout=1.0, on_error=None):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.on_full = on_full
+        self.block_timeout = block_timeout
+        self.on_error = on_error
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'rejected': 0, 'flushed': 0, 'batches': 0, 'failed': 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+            exit_on_sigterm()
+
+    def put(self, row):
+        """Queue one (device_id, ldr, water, buzzer, ts) tuple. Returns False if the queue is full."""
+        try:
+            if self.on_full == 'block':
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.stats['rejected'] += 1
+            return False
+        with self._lock:
+            self.stats['enqueued'] += 1
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=self.max_latency)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            write_readings(batch)
+            with self._lock:
+                self.stats['flushed'] += len(batch)
+                self.stats['batches'] += 1
+        except Exception as e:
+            # Only the rows of failed shards: the others are already committed
+            failed = getattr(e, 'failed_rows', batch)
+            with self._lock:
+                self.stats['flushed'] += len(batch) - len(failed)
+                self.stats['failed'] += len(failed)
+            if self.on_error:
+                self.on_error(failed, e)
+            else:
+                print(f"write-behind flush of {len(failed)} readings failed: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._write(self._collect())
+
+    def close(self):
+        """Stop the flusher and write out everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        batch = self._drain()
+        for i in range(0, len(batch), self.batch_size):
+            self._write(batch[i:i + self.batch_size])
+
+
+write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+def get_write_buffer(on_error=None):
+    """Return the shared write-behind buffer, or None unless INGEST_WRITE_BEHIND is enabled.
+
+    `on_error(batch, exc)` is only used when the buffer is first created.
+    """
+    global write_buffer
+    if os.environ.get('INGEST_WRITE_BEHIND', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _write_buffer_lock:
+        if write_buffer is not None:
+            return write_buffer
+        write_buffer = WriteBehindBuffer(
+            batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 500)),
+            max_latency=int(os.environ.get('INGEST_MAX_LATENCY_MS', 200)) / 1000.0,
+            max_queue=int(os.environ.get('INGEST_QUEUE_SIZE', 10000)),
+            on_full=os.environ.get('INGEST_QUEUE_FULL', 'reject'),
+            block_timeout=int(os.environ.get('INGEST_QUEUE_TIMEOUT_MS', 1000)) / 1000.0,
+            on_error=on_error,
+        )
+        write_buffer.start()
+        return write_buffer
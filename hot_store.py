@@ -0,0 +1,282 @@
+"""In-process hot tier: the recent readings of every device in typed column ring buffers.
+
+Each device gets four preallocated numpy arrays of `capacity` slots (int64
+epoch-second ts, int16 ldr, int8 water, int8 buzzer; -1 marks NULL) written
+as a ring, so range scans and aggregations over a window are vectorized mask
+and reduction operations instead of MySQL round trips.
+
+Memory is 12 bytes per reading: 12 MB per million readings. Arrays are
+allocated when a device is first seen, so the store never exceeds
+12 * HOT_STORE_CAPACITY * HOT_STORE_DEVICES bytes (default 4096 * 2000 = ~98 MB);
+info() reports what is allocated.
+
+Like the latest cache it is written through from the ingest endpoints and
+warmed from the database, so it is only authoritative when this process is
+the single writer. Each device tracks `since`, the ts from which its ring
+holds every row: the warm-up horizon (HOT_STORE_HOURS back), raised past any
+row the ring overwrites. A query is answered here only when its window starts
+at or after `since`; otherwise the caller falls back to the database.
+"""
+import os
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from db import get_read_db, get_shard_router
+
+EPOCH = datetime(1970, 1, 1)
+NULL = -1
+
+
+def to_epoch(ts):
+    return int((ts - EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def _column(values, dtype):
+    info = np.iinfo(dtype)
+    return np.clip(np.array([NULL if v is None else v for v in values], dtype=np.int64),
+                   info.min, info.max).astype(dtype)
+
+
+class DeviceColumns:
+    __slots__ = ('ts', 'ldr', 'water', 'buzzer', 'next', 'count', 'since')
+
+    def __init__(self, capacity, since):
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.ldr = np.zeros(capacity, dtype=np.int16)
+        self.water = np.zeros(capacity, dtype=np.int8)
+        self.buzzer = np.zeros(capacity, dtype=np.int8)
+        self.next = 0    # slot the next reading goes to
+        self.count = 0   # valid slots; below capacity they are [0, count)
+        self.since = since
+
+    @property
+    def nbytes(self):
+        return self.ts.nbytes + self.ldr.nbytes + self.water.nbytes + self.buzzer.nbytes
+
+    def append(self, ts, ldr, water, buzzer):
+        """Append equal-length column arrays, overwriting the oldest slots when full."""
+        capacity = len(self.ts)
+        if len(ts) > capacity:
+            self.since = max(self.since, int(ts[:-capacity].max()) + 1)
+            ts, ldr, water, buzzer = ts[-capacity:], ldr[-capacity:], water[-capacity:], buzzer[-capacity:]
+        slots = (self.next + np.arange(len(ts))) % capacity
+        free = capacity - self.count
+        if len(ts) > free:
+            # Everything in an overwritten slot is gone, so coverage starts after the newest of them
+            self.since = max(self.since, int(self.ts[slots[free:]].max()) + 1)
+        self.ts[slots] = ts
+        self.ldr[slots] = ldr
+        self.water[slots] = water
+        self.buzzer[slots] = buzzer
+        self.next = int(slots[-1] + 1) % capacity
+        self.count = min(capacity, self.count + len(ts))
+
+    def select(self, lo, hi=None):
+        """Slot indexes with lo <= ts < hi, in (ts, arrival) order."""
+        ts = self.ts[:self.count]
+        mask = ts >= lo
+        if hi is not None:
+            mask &= ts < hi
+        slots = np.flatnonzero(mask)
+        age = (slots - self.next) % len(self.ts)
+        return slots[np.lexsort((age, ts[slots]))]
+
+    def rows(self, device_id, slots):
+        return [{'device_id': device_id,
+                 'ldr': None if ldr == NULL else ldr,
+                 'water': None if water == NULL else water,
+                 'buzzer': None if buzzer == NULL else buzzer,
+                 'ts': from_epoch(ts)}
+                for ts, ldr, water, buzzer in zip(self.ts[slots].tolist(), self.ldr[slots].tolist(),
+                                                  self.water[slots].tolist(), self.buzzer[slots].tolist())]
+
+
+class HotStore:
+    def __init__(self, capacity=4096, max_devices=2000, hours=3):
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self.hours = hours
+        self._devices = {}
+        # Until warm-up succeeds, only rows from now on are known to be held
+        self.horizon = to_epoch(datetime.utcnow())
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, chunk_size=5000):
+        """Load the last `hours` of readings for every device from the database (every shard).
+
+        The store is replaced only once every shard has been read; on failure it
+        keeps its previous contents and horizon.
+        """
+        horizon = to_epoch(datetime.utcnow() - timedelta(hours=self.hours))
+        router = get_shard_router()
+        connections = []
+        try:
+            if router is not None:
+                for name in router.names:
+                    connections.append(router.connection(name))
+            else:
+                connections.append(get_read_db())
+            # Held for the whole scan so write-through rows cannot land in the store being replaced
+            with self._lock:
+                devices = {}
+                for conn in connections:
+                    cursor = conn.cursor(buffered=False)
+                    try:
+                        cursor.execute(
+                            "SELECT device_id, ldr, water, buzzer, ts FROM sensor_readings WHERE ts >= %s ORDER BY ts",
+                            (from_epoch(horizon),)
+                        )
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            self._add(devices, horizon, rows)
+                    finally:
+                        cursor.close()
+                self._devices = devices
+                self.horizon = horizon
+        finally:
+            for conn in connections:
+                conn.close()
+
+    def add(self, rows):
+        """Write-through from ingest: rows are (device_id, ldr, water, buzzer, ts) tuples."""
+        with self._lock:
+            self._add(self._devices, self.horizon, rows)
+
+    def _add(self, devices, horizon, rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[0], []).append(row)
+        for device_id, group in groups.items():
+            columns = devices.get(device_id)
+            if columns is None:
+                if len(devices) >= self.max_devices:
+                    continue
+                columns = devices[device_id] = DeviceColumns(self.capacity, horizon)
+            _, ldr, water, buzzer, ts = zip(*group)
+            columns.append(np.array([to_epoch(t) for t in ts], dtype=np.int64),
+                           _column(ldr, np.int16), _column(water, np.int8), _column(buzzer, np.int8))
+
+    def _covers(self, device_id, lo):
+        """The device's columns (None for a device with no rows), or False if [lo, ...) is not fully held."""
+        columns = self._devices.get(device_id)
+        if columns is None:
+            return None if len(self._devices) < self.max_devices and lo >= self.horizon else False
+        return columns if lo >= columns.since else False
+
+    def _answer(self, result):
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def latest(self, device_id=None, limit=10):
+        """Newest-first rows, or None if the newest `limit` rows are not all held here."""
+        with self._lock:
+            if device_id:
+                columns = self._devices.get(device_id)
+                if columns is None:
+                    return self._answer(None)
+                slots = columns.select(columns.since)
+                if len(slots) < limit:
+                    return self._answer(None)
+                return self._answer(columns.rows(device_id, slots[::-1][:limit]))
+            if len(self._devices) >= self.max_devices:
+                return self._answer(None)
+            candidates = []
+            for dev, columns in self._devices.items():
+                slots = columns.select(columns.since)[::-1][:limit]
+                candidates.extend(zip(columns.ts[slots].tolist(), [dev] * len(slots), slots.tolist()))
+            newest = heapq.nlargest(limit, candidates)
+            # A row missing from some ring is older than that ring's `since`, so the answer is
+            # exact only if the limit-th newest row is at least as new as every `since`
+            floor = max([c.since for c in self._devices.values()] + [self.horizon])
+            if len(newest) < limit or newest[-1][0] < floor:
+                return self._answer(None)
+            return self._answer([self._devices[dev].rows(dev, [slot])[0] for _, dev, slot in newest])
+
+    def history(self, device_id, since, until=None, limit=500):
+        """Rows with since <= ts < until oldest first, or None if not covered or more than `limit`."""
+        lo = to_epoch(since)
+        hi = to_epoch(until) if until is not None else None
+        with self._lock:
+            columns = self._covers(device_id, lo)
+            if columns is None:
+                return self._answer([])
+            if columns is False:
+                return self._answer(None)
+            slots = columns.select(lo, hi)
+            if len(slots) > limit:
+                return self._answer(None)
+            return self._answer(columns.rows(device_id, slots))
+
+    def stats(self, device_id, since, until=None):
+        """Count, LDR avg/min/max, water/buzzer-on counts and first/last ts, or None if not covered."""
+        lo = to_epoch(since)
+        hi = to_epoch(until) if until is not None else None
+        with self._lock:
+            columns = self._covers(device_id, lo)
+            if columns is False:
+                return self._answer(None)
+            if columns is None:
+                ts = ldr = water = buzzer = np.array([], dtype=np.int64)
+            else:
+                slots = columns.select(lo, hi)
+                ts, ldr, water, buzzer = (columns.ts[slots], columns.ldr[slots],
+                                          columns.water[slots], columns.buzzer[slots])
+            ldr = ldr[ldr != NULL].astype(np.int64)
+            result = {
+                'device_id': device_id,
+                'cnt': int(len(ts)),
+                'ldr_count': int(len(ldr)),
+                'avg_ldr': float(ldr.mean()) if len(ldr) else None,
+                'ldr_min': int(ldr.min()) if len(ldr) else None,
+                'ldr_max': int(ldr.max()) if len(ldr) else None,
+                'water_on': int((water == 1).sum()),
+                'buzzer_on': int((buzzer == 1).sum()),
+                'first_ts': from_epoch(ts.min()) if len(ts) else None,
+                'last_ts': from_epoch(ts.max()) if len(ts) else None,
+            }
+            return self._answer(result)
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'devices': len(self._devices),
+                    'readings': sum(c.count for c in self._devices.values()),
+                    'bytes': sum(c.nbytes for c in self._devices.values()),
+                    'max_bytes': 12 * self.capacity * self.max_devices,
+                    'horizon': from_epoch(self.horizon).isoformat()}
+
+
+hot_store = None
+_hot_store_lock = threading.Lock()
+
+def get_hot_store():
+    """Return the shared HotStore (warming it on first use), or None unless HOT_STORE is enabled."""
+    global hot_store
+    if os.environ.get('HOT_STORE', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _hot_store_lock:
+        if hot_store is None:
+            hot_store = HotStore(
+                capacity=int(os.environ.get('HOT_STORE_CAPACITY', 4096)),
+                max_devices=int(os.environ.get('HOT_STORE_DEVICES', 2000)),
+                hours=float(os.environ.get('HOT_STORE_HOURS', 3)),
+            )
+            try:
+                hot_store.warm()
+            except Exception as e:
+                # Still usable: coverage starts now and grows as readings arrive
+                print(f"hot store warm-up failed: {e}")
+        return hot_store
@@ -0,0 +1,279 @@
+import os
+import json
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Compact binary record for ESP nodes (little-endian, 24 bytes):
+#   16s device_id (ASCII, NUL-padded) | H ldr | B water | B buzzer | I epoch seconds (UTC)
+# ldr 0xFFFF / water, buzzer 0xFF mean "not reported"; ts 0 means "use server time".
+BINARY_CONTENT_TYPE = 'application/x-sensor-record'
+BINARY_RECORD = struct.Struct('<16sHBBI')
+
+# Column limits from models.sql: a value outside them fails the whole multi-row insert
+MAX_DEVICE_ID = 64
+INT_RANGE = (-2**31, 2**31 - 1)
+TINYINT_RANGE = (-128, 127)
+
+
+def _to_int(value, field, limits):
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer")
+    low, high = limits
+    if not low <= number <= high:
+        raise ValueError(f"{field} must be between {low} and {high}")
+    return number
+
+
+def _utcnow():
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def parse_timestamp(ts):
+    """Parse an ISO timestamp (optionally with trailing 'Z'), falling back to now.
+
+    Always returns naive UTC with whole seconds, which is what a DATETIME
+    column stores: an offset would be dropped by the driver and fractional
+    seconds rounded, putting the stored row in a different rollup bucket than
+    the one it was counted in.
+    """
+    if not ts:
+        return _utcnow()
+    try:
+        parsed = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    except Exception:
+        return _utcnow()
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.replace(microsecond=0)
+
+
+def parse_reading(data):
+    """Validate a single reading payload.
+
+    Returns a (device_id, ldr, water, buzzer, ts) tuple ready for insert,
+    raises ValueError with a client-facing message otherwise.
+    """
+    if not isinstance(data, dict) or not data:
+        raise ValueError("Invalid JSON")
+
+    device_id = data.get('device_id') or data.get('id')
+    if not device_id:
+        raise ValueError("device_id is required")
+    device_id = str(device_id)
+    if len(device_id) > MAX_DEVICE_ID:
+        raise ValueError(f"device_id must be at most {MAX_DEVICE_ID} characters")
+
+    ldr = _to_int(data.get('ldr'), 'ldr', INT_RANGE)
+    water = _to_int(data.get('water'), 'water', TINYINT_RANGE)
+    buzzer = _to_int(data.get('buzzer'), 'buzzer', TINYINT_RANGE)
+    ts = parse_timestamp(data.get('ts'))
+
+    return (device_id, ldr, water, buzzer, ts)
+
+
+def parse_line(line):
+    """Parse one line-protocol reading: `device_id ldr water buzzer [ts]`.
+
+    Fields are whitespace separated; `-` marks a missing value and `ts` may be
+    ISO-8601 or integer epoch seconds. Same validation as parse_reading.
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    fields = line.split()
+    if len(fields) not in (4, 5):
+        raise ValueError("Expected 'device_id ldr water buzzer [ts]'")
+    values = [None if f == '-' else f for f in fields]
+    ts = values[4] if len(values) == 5 else None
+    if ts and ts.isdigit():
+        try:
+            ts = datetime.utcfromtimestamp(int(ts)).isoformat()
+        except (OverflowError, OSError, ValueError):
+            raise ValueError("ts epoch seconds out of range")
+    return parse_reading({
+        'device_id': values[0],
+        'ldr': values[1],
+        'water': values[2],
+        'buzzer': values[3],
+        'ts': ts,
+    })
+
+def parse_batch_body(body):
+    """Split a batch request body into reading payloads.
+
+    Accepts either a JSON array of objects or NDJSON (one object per line).
+    Items that are not valid JSON are returned as None so the caller can
+    reject them by index. Raises ValueError if the body is empty.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    text = body.strip()
+    if not text:
+        raise ValueError("Empty body")
+
+    if text.startswith('['):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            raise ValueError("Invalid JSON array")
+        return list(items)
+
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items
+
+
+def validate_batch(items):
+    """Validate every item in one pass.
+
+    Returns (rows, results): rows are insert-ready tuples for the accepted
+    items, results has one {"index", "status"[, "error"]} entry per item.
+    """
+    rows = []
+    results = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(parse_reading(item))
+            results.append({"index": index, "status": "accepted"})
+        except ValueError as e:
+            results.append({"index": index, "status": "rejected", "error": str(e)})
+    return rows, results
+
+
+def decode_binary_batch(body):
+    """Decode packed BINARY_RECORD readings without copying the request body.
+
+    Returns (rows, results) in the same shape as validate_batch. Raises
+    ValueError if the body is not a whole number of records.
+    """
+    view = memoryview(body)
+    if not view.nbytes or view.nbytes % BINARY_RECORD.size:
+        raise ValueError(f"Binary body must be a multiple of {BINARY_RECORD.size} bytes")
+
+    rows = []
+    results = []
+    utcfromtimestamp = datetime.utcfromtimestamp
+    for index, (raw_id, ldr, water, buzzer, epoch) in enumerate(BINARY_RECORD.iter_unpack(view)):
+        device_id = raw_id.rstrip(b'\0').decode('ascii', 'replace')
+        if not device_id:
+            results.append({"index": index, "status": "rejected", "error": "device_id is required"})
+            continue
+        if (water > TINYINT_RANGE[1] and water != 0xFF) or (buzzer > TINYINT_RANGE[1] and buzzer != 0xFF):
+            results.append({"index": index, "status": "rejected",
+                            "error": f"water and buzzer must be at most {TINYINT_RANGE[1]}"})
+            continue
+        rows.append((
+            device_id,
+            None if ldr == 0xFFFF else ldr,
+            None if water == 0xFF else water,
+            None if buzzer == 0xFF else buzzer,
+            utcfromtimestamp(epoch) if epoch else _utcnow(),
+        ))
+        results.append({"index": index, "status": "accepted"})
+    return rows, results
+
+
+def encode_binary(device_id, ldr, water, buzzer, epoch=0):
+    """Pack one reading as a BINARY_RECORD (used by test clients and benchmarks)."""
+    return BINARY_RECORD.pack(
+        device_id.encode('ascii')[:16],
+        0xFFFF if ldr is None else ldr,
+        0xFF if water is None else water,
+        0xFF if buzzer is None else buzzer,
+        int(epoch),
+    )
+
+
+class DedupCache:
+    """Bounded recent-keys cache that drops device retransmits before they hit MySQL.
+
+    Keeps the last `per_device` timestamps for each of up to `max_devices`
+    devices; the least recently active device is evicted first.
+    """
+
+    def __init__(self, per_device=256, max_devices=10000):
+        self.per_device = per_device
+        self.max_devices = max_devices
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def seen(self, device_id, ts):
+        """Record (device_id, ts); return True if it was already in the cache."""
+        with self._lock:
+            keys = self._devices.get(device_id)
+            if keys is None:
+                keys = self._devices[device_id] = OrderedDict()
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(device_id)
+            if ts in keys:
+                self.hits += 1
+                return True
+            keys[ts] = None
+            if len(keys) > self.per_device:
+                keys.popitem(last=False)
+            self.misses += 1
+            return False
+
+    def filter(self, rows, results=None):
+        """Drop rows already seen; mark their accepted entries in `results` as duplicates."""
+        accepted = [r for r in results if r['status'] == 'accepted'] if results is not None else [None] * len(rows)
+        fresh = []
+        for row, result in zip(rows, accepted):
+            if self.seen(row[0], row[4]):
+                if result is not None:
+                    result['status'] = 'duplicate'
+            else:
+                fresh.append(row)
+        return fresh
+
+    def forget(self, rows):
+        """Remove keys for rows that were not stored, so a device retry is accepted."""
+        with self._lock:
+            for row in rows:
+                keys = self._devices.get(row[0])
+                if keys is not None:
+                    keys.pop(row[4], None)
+
+    def info(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'devices': len(self._devices),
+                'keys': sum(len(k) for k in self._devices.values()),
+            }
+
+
+dedup_cache = None
+_dedup_lock = threading.Lock()
+
+def get_dedup_cache():
+    """Return the shared DedupCache, or None when INGEST_DEDUP=0."""
+    global dedup_cache
+    if os.environ.get('INGEST_DEDUP', '1').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _dedup_lock:
+        if dedup_cache is None:
+            dedup_cache = DedupCache(
+                per_device=int(os.environ.get('INGEST_DEDUP_PER_DEVICE', 256)),
+                max_devices=int(os.environ.get('INGEST_DEDUP_DEVICES', 10000)),
+            )
+        return dedup_cache
@@ -0,0 +1,142 @@
+"""In-process cache of the most recent readings per device for /api/v1/sensor/latest.
+
+Holds the newest `size` readings for every device plus the newest `size`
+across all devices, ordered by ts. It is written through from the ingest
+endpoints and warmed from MySQL at startup, so it is only authoritative when
+this process is the single writer (other writers such as uploadData.py bypass
+it); enable it with LATEST_CACHE=1 in that setup.
+
+A device's buffer is "complete" when it is known to contain every stored row
+(fewer than `size` rows existed at warm-up, or the device first appeared after
+it). A request is served from memory when the limit fits in the buffer or the
+buffer is complete; otherwise the caller falls back to the database.
+"""
+import os
+import bisect
+import threading
+
+from db import get_db, databases, get_shard_router, fetch_latest_readings
+
+
+class _Ring:
+    __slots__ = ('keys', 'rows', 'complete')
+
+    def __init__(self, complete):
+        self.keys = []   # ts, ascending
+        self.rows = []
+        self.complete = complete
+
+    def add(self, row, size):
+        ts = row['ts']
+        if len(self.keys) >= size and ts < self.keys[0]:
+            # Older than everything we keep: the buffer still holds the newest `size`
+            self.complete = False
+            return
+        i = bisect.bisect_right(self.keys, ts)
+        self.keys.insert(i, ts)
+        self.rows.insert(i, row)
+        if len(self.keys) > size:
+            del self.keys[0]
+            del self.rows[0]
+            self.complete = False
+
+    def newest(self, limit):
+        return self.rows[-limit:][::-1] if limit > 0 else []
+
+
+class LatestCache:
+    def __init__(self, size=100, max_devices=10000):
+        self.size = size
+        self.max_devices = max_devices
+        self._devices = {}
+        self._all = _Ring(complete=False)
+        self._warm = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self):
+        """Load the newest `size` rows per device (and overall) from MySQL (every shard)."""
+        devices = {}
+        for connect in databases().values():
+            conn = connect()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT DISTINCT device_id FROM sensor_readings")
+                device_ids = [r[0] for r in cursor.fetchall()][:self.max_devices - len(devices)]
+            finally:
+                cursor.close()
+                conn.close()
+            for device_id in device_ids:
+                rows = fetch_latest_readings(connect(), device_id=device_id, limit=self.size)
+                ring = _Ring(complete=len(rows) < self.size)
+                for row in reversed(rows):
+                    ring.add(row, self.size)
+                devices[device_id] = ring
+        router = get_shard_router()
+        rows = router.fetch_latest(limit=self.size) if router else fetch_latest_readings(get_db(), limit=self.size)
+        everything = _Ring(complete=len(rows) < self.size)
+        for row in reversed(rows):
+            everything.add(row, self.size)
+        with self._lock:
+            self._devices = devices
+            self._all = everything
+            self._warm = True
+
+    def add(self, rows):
+        """Write-through from ingest: rows are (device_id, ldr, water, buzzer, ts) tuples."""
+        with self._lock:
+            for device_id, ldr, water, buzzer, ts in rows:
+                row = {'device_id': device_id, 'ldr': ldr, 'water': water,
+                       'buzzer': buzzer, 'ts': ts}
+                ring = self._devices.get(device_id)
+                if ring is None:
+                    if len(self._devices) >= self.max_devices:
+                        continue
+                    # After warm-up, a device we have never seen has no older rows in the DB
+                    ring = self._devices[device_id] = _Ring(complete=self._warm)
+                ring.add(row, self.size)
+                self._all.add(row, self.size)
+
+    def get(self, device_id=None, limit=10):
+        """Newest-first rows, or None if the cache cannot answer this request exactly."""
+        with self._lock:
+            ring = self._all if not device_id else self._devices.get(device_id)
+            if ring is None:
+                if self._warm and len(self._devices) < self.max_devices:
+                    self.hits += 1
+                    return []
+                self.misses += 1
+                return None
+            if limit <= len(ring.rows) or ring.complete:
+                self.hits += 1
+                return ring.newest(limit)
+            self.misses += 1
+            return None
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'devices': len(self._devices),
+                    'size': self.size, 'warm': self._warm}
+
+
+latest_cache = None
+_latest_cache_lock = threading.Lock()
+
+def get_latest_cache():
+    """Return the shared LatestCache (warming it on first use), or None unless LATEST_CACHE is enabled."""
+    global latest_cache
+    if os.environ.get('LATEST_CACHE', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _latest_cache_lock:
+        if latest_cache is None:
+            latest_cache = LatestCache(
+                size=int(os.environ.get('LATEST_CACHE_SIZE', 100)),
+                max_devices=int(os.environ.get('LATEST_CACHE_DEVICES', 10000)),
+            )
+            try:
+                latest_cache.warm()
+            except Exception as e:
+                # Still usable: buffers fill from ingest, and requests that do not fit fall back to MySQL
+                print(f"latest cache warm-up failed: {e}")
+        return latest_cache
@@ -0,0 +1,172 @@
+"""
+Line-protocol listener for sensor readings over raw TCP and UDP.
+
+Each reading is one newline-terminated line:
+
+  device_id ldr water buzzer [ts]      e.g.  esp01 450 1 0 1760000000
+
+`-` marks a missing value; ts is optional (ISO-8601 or epoch seconds).
+Lines are parsed per received chunk and handed to a WriteBehindBuffer, so
+they reach sensor_readings through multi-row inserts. Failed flushes go to
+the local spool when INGEST_SPOOL_DIR is set.
+
+Usage:
+  python line_listener.py                 # TCP and UDP on LINE_PORT (default 5140)
+  LINE_STATS_S=10 python line_listener.py # print per-source stats every 10s
+"""
+import os
+import time
+import asyncio
+from collections import defaultdict
+
+from db import WriteBehindBuffer
+from ingest import parse_line, get_dedup_cache
+from spool import get_spool
+
+
+class SourceStats:
+    def __init__(self):
+        self.readings = 0
+        self.malformed = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.bytes = 0
+        self.first_seen = time.monotonic()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.first_seen
+        return self.readings / elapsed if elapsed > 0 else 0.0
+
+
+class LineIngest:
+    """Parses line batches from any transport and feeds the write-behind buffer."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.dedup = get_dedup_cache()
+        self.sources = defaultdict(SourceStats)
+
+    def feed(self, source, lines, nbytes):
+        stats = self.sources[source]
+        stats.bytes += nbytes
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = parse_line(line)
+            except (ValueError, UnicodeDecodeError):
+                stats.malformed += 1
+                continue
+            if self.dedup is not None and self.dedup.seen(row[0], row[4]):
+                stats.duplicates += 1
+                continue
+            if self.buffer.put(row):
+                stats.readings += 1
+            else:
+                stats.dropped += 1
+                if self.dedup is not None:
+                    self.dedup.forget([row])
+
+    def report(self):
+        total_readings = sum(s.readings for s in self.sources.values())
+        total_malformed = sum(s.malformed for s in self.sources.values())
+        print(f"📡 {len(self.sources)} sources | {total_readings} readings | "
+              f"{total_malformed} malformed | queue depth {self.buffer.depth()} | "
+              f"flushed {self.buffer.stats['flushed']}")
+        for source, s in sorted(self.sources.items()):
+            print(f"   {source:<24} {s.readings:>9} ok {s.malformed:>6} bad {s.dropped:>6} dropped "
+                  f"{s.duplicates:>6} dup {s.bytes:>11} B  {s.rate():>8.1f}/s")
+
+
+class TCPLineProtocol(asyncio.Protocol):
+    # No valid line comes close; a client that never sends a newline must not grow `pending` forever
+    MAX_PENDING = int(os.environ.get('LINE_MAX_BYTES', 4096))
+
+    def __init__(self, ingest):
+        self.ingest = ingest
+        self.pending = b''
+        self.discarding = False
+        self.source = None
+
+    def connection_made(self, transport):
+        host, port = transport.get_extra_info('peername')[:2]
+        self.source = f"tcp:{host}"
+
+    def data_received(self, data):
+        nbytes = len(data)
+        if self.discarding:
+            # Skip the rest of an overlong line
+            end = data.find(b'\n')
+            if end == -1:
+                self.ingest.feed(self.source, [], nbytes)
+                return
+            data = data[end + 1:]
+            self.discarding = False
+        chunk = self.pending + data
+        lines = chunk.split(b'\n')
+        self.pending = lines.pop()
+        self.ingest.feed(self.source, lines, nbytes)
+        if len(self.pending) > self.MAX_PENDING:
+            self.ingest.sources[self.source].malformed += 1
+            self.pending = b''
+            self.discarding = True
+
+    def connection_lost(self, exc):
+        if self.pending:
+            self.ingest.feed(self.source, [self.pending], 0)
+            self.pending = b''
+
+
+class UDPLineProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        self.ingest.feed(f"udp:{addr[0]}", data.split(b'\n'), len(data))
+
+
+def _spool_failed_batch(batch, error):
+    spool = get_spool()
+    if spool is None:
+        print(f"❌ Flush of {len(batch)} readings failed: {error}")
+        return
+    spool.append(batch)
+
+
+async def serve(host, port, ingest, stats_interval):
+    loop = asyncio.get_running_loop()
+    tcp = await loop.create_server(lambda: TCPLineProtocol(ingest), host, port)
+    udp, _ = await loop.create_datagram_endpoint(lambda: UDPLineProtocol(ingest), local_addr=(host, port))
+    print(f"🚀 Listening for line protocol on tcp/udp {host}:{port}")
+    try:
+        while True:
+            await asyncio.sleep(stats_interval)
+            ingest.report()
+    finally:
+        tcp.close()
+        udp.close()
+
+
+def main():
+    host = os.environ.get('LINE_HOST', '0.0.0.0')
+    port = int(os.environ.get('LINE_PORT', 5140))
+    stats_interval = float(os.environ.get('LINE_STATS_S', 30))
+    buffer = WriteBehindBuffer(
+        batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 500)),
+        max_latency=int(os.environ.get('INGEST_MAX_LATENCY_MS', 200)) / 1000.0,
+        max_queue=int(os.environ.get('INGEST_QUEUE_SIZE', 10000)),
+        on_error=_spool_failed_batch,
+    )
+    buffer.start()
+    ingest = LineIngest(buffer)
+    try:
+        asyncio.run(serve(host, port, ingest, stats_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        buffer.close()
+        ingest.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Fleet load generator and latency benchmark for the ingest API.
+
+Simulates many water-tank devices (each filling and draining its own tank)
+across several processes and posts their readings to any server that speaks
+the /api/v1/sensor contract (main.py, async_server.py, ...).
+
+Usage:
+  python load_test.py --devices 2000 --rate 500 --duration 30
+  python load_test.py --mode batch --batch-size 50 --rate 5000
+  python load_test.py --mode binary --url http://127.0.0.1:5001 --processes 8
+
+--rate is the total readings/second across all processes (0 = as fast as possible).
+"""
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import multiprocessing
+from collections import Counter
+from datetime import datetime
+
+import requests
+
+from ingest import encode_binary, BINARY_CONTENT_TYPE
+
+# Log-scale latency histogram: bucket i covers [BASE**i, BASE**(i+1)) microseconds (~2% resolution)
+HIST_BASE = 1.02
+
+
+class Tank:
+    """One simulated device: level drifts up while the pump runs and down while it drains.
+
+    Each reading gets its own epoch second, as a device would stamp it. Binary
+    records carry whole seconds, so a tank stepped faster than once a second
+    runs its clock ahead rather than repeat a (device_id, ts) the server would
+    drop as a duplicate.
+    """
+
+    def __init__(self, device_id, rng):
+        self.device_id = device_id
+        self.rng = rng
+        self.level = rng.uniform(10, 90)
+        self.filling = rng.random() < 0.5
+        self.epoch = 0
+
+    def step(self):
+        if self.filling:
+            self.level += self.rng.uniform(0.5, 2.0)
+            if self.level >= 95:
+                self.filling = False
+        else:
+            self.level -= self.rng.uniform(0.2, 1.5)
+            if self.level <= 5:
+                self.filling = True
+        self.level = min(100.0, max(0.0, self.level))
+        hour = datetime.utcnow().hour
+        ldr = int(self.rng.gauss(800 if 6 <= hour < 18 else 200, 40))
+        self.epoch = max(int(time.time()), self.epoch + 1)
+        return (self.device_id, max(0, min(1023, ldr)), int(self.level > 20), int(self.level < 10), self.epoch)
+
+
+def record_latency(hist, seconds):
+    micros = max(1.0, seconds * 1e6)
+    hist[int(math.log(micros, HIST_BASE))] += 1
+
+
+def percentile(hist, pct):
+    total = sum(hist.values())
+    if not total:
+        return 0.0
+    target = total * pct / 100.0
+    seen = 0
+    for bucket in sorted(hist):
+        seen += hist[bucket]
+        if seen >= target:
+            return HIST_BASE ** (bucket + 1) / 1000.0  # upper bound, ms
+    return 0.0
+
+
+def _payload(mode, readings):
+    if mode == 'binary':
+        return (b''.join(encode_binary(d, l, w, b, epoch) for d, l, w, b, epoch in readings),
+                {'Content-Type': BINARY_CONTENT_TYPE})
+    docs = [{"device_id": d, "ldr": l, "water": w, "buzzer": b,
+             "ts": datetime.utcfromtimestamp(epoch).isoformat() + 'Z'} for d, l, w, b, epoch in readings]
+    if mode == 'single':
+        return docs[0], None
+    return '\n'.join(json.dumps(doc) for doc in docs), {'Content-Type': 'application/x-ndjson'}
+
+
+def _accepted(mode, response, sent):
+    """Readings the server stored or queued, from the response body (duplicates and rejects excluded)."""
+    try:
+        body = response.json()
+    except ValueError:
+        return sent
+    if mode == 'single':
+        return 0 if body.get('status') == 'duplicate' else 1
+    return body.get('accepted', sent)
+
+
+def _worker_thread(args, tanks, interval, deadline, hist, errors, counts, lock):
+    session = requests.Session()
+    url = args.url.rstrip('/') + ('/api/v1/sensor' if args.mode == 'single' else '/api/v1/sensor/batch')
+    per_request = 1 if args.mode == 'single' else args.batch_size
+    next_send = time.monotonic()
+    i = 0
+    while time.monotonic() < deadline:
+        readings = []
+        for _ in range(per_request):
+            readings.append(tanks[i % len(tanks)].step())
+            i += 1
+        body, headers = _payload(args.mode, readings)
+        started = time.monotonic()
+        try:
+            if isinstance(body, dict):
+                r = session.post(url, json=body, timeout=args.timeout)
+            else:
+                r = session.post(url, data=body, headers=headers, timeout=args.timeout)
+            status = r.status_code
+            error = None if status < 300 else f"HTTP {status}"
+            accepted = _accepted(args.mode, r, len(readings)) if not error else 0
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed = time.monotonic() - started
+        with lock:
+            record_latency(hist, elapsed)
+            counts['requests'] += 1
+            counts['sent'] += len(readings)
+            if error:
+                errors[error] += 1
+            else:
+                counts['readings'] += accepted
+        if interval:
+            next_send += interval
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def run_process(args, proc_index, queue):
+    rng = random.Random(args.seed + proc_index)
+    tanks = [Tank(f"sim{n:05d}", rng) for n in range(proc_index, args.devices, args.processes)]
+    hist, errors, counts = Counter(), Counter(), Counter()
+    lock = threading.Lock()
+    per_request = 1 if args.mode == 'single' else args.batch_size
+    # Each thread gets an equal share of this process's request rate
+    thread_rate = args.rate / per_request / args.processes / args.threads if args.rate else 0
+    interval = 1.0 / thread_rate if thread_rate else 0
+    deadline = time.monotonic() + args.duration
+    threads = []
+    for t in range(args.threads):
+        share = tanks[t::args.threads] or tanks
+        th = threading.Thread(target=_worker_thread,
+                              args=(args, share, interval, deadline, hist, errors, counts, lock))
+        th.start()
+        threads.append(th)
+    for th in threads:
+        th.join()
+    queue.put((dict(hist), dict(errors), dict(counts)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet load generator for the sensor ingest API")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base URL')
+    parser.add_argument('--mode', choices=['single', 'batch', 'binary'], default='single')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=0, help='target readings/s in total (0 = max)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--threads', type=int, default=4, help='concurrent connections per process')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🚀 Load test: {args.devices} devices, mode={args.mode}, "
+          f"{args.processes} procs x {args.threads} threads, {args.duration:.0f}s")
+    print(f"   Target: {args.url}  rate: {args.rate or 'max'} readings/s")
+    print("=" * 60)
+
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=run_process, args=(args, i, queue)) for i in range(args.processes)]
+    started = time.monotonic()
+    for p in procs:
+        p.start()
+    hist, errors, counts = Counter(), Counter(), Counter()
+    for _ in procs:
+        h, e, c = queue.get()
+        hist.update(h)
+        errors.update(e)
+        counts.update(c)
+    for p in procs:
+        p.join()
+    elapsed = time.monotonic() - started
+
+    print(f"\n📈 Results ({elapsed:.1f}s wall clock)")
+    print(f"  Requests:   {counts['requests']:,} ({counts['requests'] / elapsed:,.0f}/s)")
+    print(f"  Readings:   {counts['readings']:,} ({counts['readings'] / elapsed:,.0f}/s accepted, "
+          f"{counts['sent']:,} sent)")
+    print("  Latency (ms):")
+    for label, pct in (('p50', 50), ('p95', 95), ('p99', 99), ('p999', 99.9)):
+        print(f"    {label:<5} {percentile(hist, pct):>9.2f}")
+    if errors:
+        print("  Errors:")
+        for error, n in errors.most_common():
+            print(f"    {error:<24} {n:,}")
+    else:
+        print("  Errors: none")
+
+
+if __name__ == '__main__':
+    main()
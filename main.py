@@ -1,15 +1,94 @@
 import os
-from flask import Flask, request, jsonify
-from db import get_db, insert_reading, fetch_latest_readings
-from datetime import datetime
+from flask import Flask, Response, request, jsonify, stream_with_context
+import db
+from db import (get_read_db, write_readings, fetch_latest_readings, iter_latest_readings, fetch_history,
+                fetch_rollups, fetch_window_stats, get_write_buffer, get_shard_router, is_unavailable)
+from ingest import (parse_reading, parse_batch_body, validate_batch, decode_binary_batch,
+                    get_dedup_cache, BINARY_CONTENT_TYPE)
+from spool import get_spool
+from ratelimit import get_rate_limiter, is_critical
+from latest_cache import get_latest_cache
+from hot_store import get_hot_store
+from csv_cache import get_csv_cache
+from datetime import datetime, timezone
+import time
+import json
+import itertools
+import base64
 from flask import render_template, send_from_directory
-import csv
 import os
 
 app = Flask(__name__)
 app.static_folder = 'static'
 app.template_folder = 'templates'
 
+# DB writes slower than this push ingest onto the local spool for a cooldown period
+DB_WRITE_BUDGET = int(os.environ.get('INGEST_DB_BUDGET_MS', 250)) / 1000.0
+
+
+def _spool_failed_batch(batch, error):
+    """Write-behind error hook: keep a batch the flusher could not insert."""
+    spool = get_spool()
+    if spool is None:
+        print(f"write-behind flush of {len(batch)} readings failed: {error}")
+        return
+    spool.append(batch)
+    if is_unavailable(error):
+        spool.mark_degraded()
+
+
+def _store_rows(rows):
+    """Insert rows, diverting them to the spool when MySQL is failing or slow.
+
+    Returns True if the rows were written to MySQL, False if they were spooled.
+    Only connection-level failures are spooled (db.is_unavailable); errors on
+    the data itself, and any error when no spool is configured, are re-raised.
+    When only some shards fail, only their rows are spooled
+    (ShardWriteError.failed_rows).
+    """
+    spool = get_spool()
+    if spool is not None and spool.is_degraded():
+        spool.append(rows)
+        return False
+
+    started = time.monotonic()
+    try:
+        write_readings(rows)
+    except Exception as e:
+        if spool is None or not is_unavailable(e):
+            raise
+        spool.append(getattr(e, 'failed_rows', rows))
+        spool.mark_degraded()
+        return False
+
+    if spool is not None and time.monotonic() - started > DB_WRITE_BUDGET:
+        spool.mark_degraded()
+    return True
+
+
+def _remember(rows):
+    """Write-through to the last-value cache and hot tier once rows are accepted for storage."""
+    cache = get_latest_cache()
+    if cache is not None and rows:
+        cache.add(rows)
+    store = get_hot_store()
+    if store is not None and rows:
+        store.add(rows)
+
+
+def _too_many(message):
+    response = jsonify({"error": message})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+
+def _batch_summary(results):
+    counts = {'accepted': 0, 'duplicate': 0, 'rejected': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {"accepted": counts['accepted'], "duplicates": counts['duplicate'],
+            "rejected": counts['rejected'], "results": results}
+
 @app.route('/api/v1/sensor', methods=['POST'])
 def ingest_sensor():
     """Expect JSON payload:
@@ -20,48 +99,359 @@ def ingest_sensor():
       "buzzer": 1,
       "ts": "2025-10-21T12:34:56Z"  # optional ISO timestamp
     }
+    or a single 24-byte record with Content-Type: application/x-sensor-record
+    (layout in ingest.BINARY_RECORD).
     """
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Invalid JSON"}), 400
+    try:
+        if request.mimetype == BINARY_CONTENT_TYPE:
+            rows, results = decode_binary_batch(request.get_data())
+            if len(results) != 1:
+                raise ValueError("Expected exactly one binary record")
+            if not rows:
+                raise ValueError(results[0]['error'])
+            device_id, ldr, water, buzzer, ts = rows[0]
+        else:
+            device_id, ldr, water, buzzer, ts = parse_reading(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    device_id = data.get('device_id') or data.get('id')
-    ldr = data.get('ldr')
-    water = data.get('water')
-    buzzer = data.get('buzzer')
-    ts = data.get('ts')
+    row = (device_id, ldr, water, buzzer, ts)
+    critical = is_critical(row)
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return _write_single(row)
+    if not limiter.allow(device_id, critical):
+        return _too_many("Rate limit exceeded for device")
+    with limiter.slot(critical) as admitted:
+        if not admitted:
+            return _too_many("Ingest busy")
+        return _write_single(row)
 
-    if not device_id:
-        return jsonify({"error": "device_id is required"}), 400
+
+def _write_single(row):
+    dedup = get_dedup_cache()
+    if dedup is not None and dedup.seen(row[0], row[4]):
+        # Retransmit of a reading we already stored: acknowledge so the device stops retrying
+        return jsonify({"status": "duplicate"}), 201
+
+    buffer = get_write_buffer(on_error=_spool_failed_batch)
+    if buffer is not None:
+        if not buffer.put(row):
+            if dedup is not None:
+                dedup.forget([row])
+            return jsonify({"error": "Ingest queue full"}), 503
+        _remember([row])
+        return jsonify({"status": "queued"}), 202
 
     try:
-        if ts:
-            ts = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+        stored = _store_rows([row])
+    except Exception as e:
+        if dedup is not None:
+            dedup.forget([row])
+        return jsonify({"error": str(e)}), 500
+
+    _remember([row])
+    if not stored:
+        return jsonify({"status": "spooled"}), 202
+    return jsonify({"status": "ok"}), 201
+
+@app.route('/api/v1/sensor/batch', methods=['POST'])
+def ingest_sensor_batch():
+    """Accept many readings at once, as a JSON array or NDJSON (one object per line).
+
+    Every item is validated with the same rules as /api/v1/sensor; valid ones
+    are written with a single multi-row insert. Response:
+    {"accepted": 2, "duplicates": 0, "rejected": 1, "results": [{"index": 0, "status": "accepted"}, ...]}
+    Retransmitted (device_id, ts) pairs are reported with status "duplicate" and not re-inserted.
+    Concatenated binary records (Content-Type: application/x-sensor-record) are also accepted.
+    """
+    try:
+        if request.mimetype == BINARY_CONTENT_TYPE:
+            rows, results = decode_binary_batch(request.get_data())
         else:
-            ts = datetime.utcnow()
-    except Exception:
-        ts = datetime.utcnow()
+            rows, results = validate_batch(parse_batch_body(request.get_data()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return _write_batch(rows, results)
+
+    # Per-device buckets apply item by item; critical readings always pass
+    admitted_rows = []
+    accepted = [r for r in results if r['status'] == 'accepted']
+    for row, result in zip(rows, accepted):
+        if limiter.allow(row[0], is_critical(row)):
+            admitted_rows.append(row)
+        else:
+            result['status'] = 'rejected'
+            result['error'] = 'Rate limit exceeded for device'
+    if rows and not admitted_rows:
+        return _too_many("Rate limit exceeded for device")
+    rows = admitted_rows
+
+    critical = any(is_critical(row) for row in rows)
+    with limiter.slot(critical) as admitted:
+        if not admitted:
+            return _too_many("Ingest busy")
+        return _write_batch(rows, results)
+
+
+def _write_batch(rows, results):
+    dedup = get_dedup_cache()
+    if dedup is not None:
+        rows = dedup.filter(rows, results)
+
+    buffer = get_write_buffer(on_error=_spool_failed_batch)
+    if rows and buffer is not None:
+        accepted = [r for r in results if r['status'] == 'accepted']
+        queued = []
+        for row, result in zip(rows, accepted):
+            if buffer.put(row):
+                queued.append(row)
+            else:
+                result['status'] = 'rejected'
+                result['error'] = 'Ingest queue full'
+                if dedup is not None:
+                    dedup.forget([row])
+        _remember(queued)
+        return jsonify(_batch_summary(results)), 202 if queued else 503
+
+    body = _batch_summary(results)
+    if not rows:
+        return jsonify(body), 201 if body['duplicates'] else 400
 
     try:
-        conn = get_db()
-        insert_reading(conn, device_id, ldr, water, buzzer, ts)
+        stored = _store_rows(rows)
     except Exception as e:
+        if dedup is not None:
+            # Rows committed on healthy shards stay remembered, so a client retry is acknowledged as duplicates
+            dedup.forget(getattr(e, 'failed_rows', rows))
         return jsonify({"error": str(e)}), 500
 
-    return jsonify({"status": "ok"}), 201
+    _remember(rows)
+    return jsonify(body), 201 if stored else 202
+
+def _stream_rows(chunks, fmt):
+    """Encode row chunks as NDJSON lines or as one JSON array, chunk by chunk."""
+    dumps = app.json.dumps
+    if fmt == 'ndjson':
+        for rows in chunks:
+            yield ''.join(dumps(row) + '\n' for row in rows)
+        return
+    yield '['
+    first = True
+    for rows in chunks:
+        body = ','.join(dumps(row) for row in rows)
+        yield body if first else ',' + body
+        first = False
+    yield ']'
 
 @app.route('/api/v1/sensor/latest', methods=['GET'])
 def latest():
+    """Latest readings, newest first. Query params: device_id, limit, stream.
+
+    stream=json or stream=ndjson sends the rows as they are read from an
+    unbuffered cursor, so memory stays flat for large limits.
+    """
     device_id = request.args.get('device_id')
     limit = int(request.args.get('limit') or 10)
+    stream = request.args.get('stream')
+    router = get_shard_router()
+    if stream in ('json', 'ndjson'):
+        try:
+            if router is None:
+                chunks = iter_latest_readings(get_read_db(), device_id=device_id, limit=limit)
+            elif device_id:
+                chunks = iter_latest_readings(router.connection_for(device_id), device_id=device_id, limit=limit)
+            else:
+                # Fleet-wide rows have to be merged across shards before the first one can be sent
+                chunks = iter([router.fetch_latest(limit=limit)])
+            # The generator runs the query on first use: do that before the 200 status is sent
+            first = next(chunks, None)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        chunks = itertools.chain([first], chunks) if first is not None else []
+        mimetype = 'application/x-ndjson' if stream == 'ndjson' else 'application/json'
+        return Response(stream_with_context(_stream_rows(chunks, stream)), mimetype=mimetype)
+
+    cache = get_latest_cache()
+    if cache is not None:
+        rows = cache.get(device_id=device_id, limit=limit)
+        if rows is not None:
+            return jsonify(rows)
+    store = get_hot_store()
+    if store is not None:
+        rows = store.latest(device_id=device_id, limit=limit)
+        if rows is not None:
+            return jsonify(rows)
     try:
-        conn = get_db()
+        if router is not None:
+            return jsonify(router.fetch_latest(device_id=device_id, limit=limit))
+        conn = get_read_db()
         rows = fetch_latest_readings(conn, device_id=device_id, limit=limit)
         return jsonify(rows)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _encode_cursor(row):
+    raw = json.dumps([row['ts'].isoformat(), row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _query_time(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO timestamp")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+@app.route('/api/v1/sensor/history', methods=['GET'])
+def history():
+    """Keyset-paginated readings for one device, oldest first.
+
+    Query params: device_id (required), since, until (ISO timestamps, until is
+    exclusive), limit (default 500, max 5000), cursor (next_cursor from the
+    previous page). Response: {"rows": [...], "next_cursor": "..." or null}
+    """
+    device_id = request.args.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_id is required"}), 400
+    try:
+        since = _query_time('since')
+        until = _query_time('until')
+        after = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = min(max(int(request.args.get('limit') or 500), 1), 5000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    store = get_hot_store()
+    if store is not None and since is not None and after is None:
+        # Recent windows that fit in one page come straight from memory
+        rows = store.history(device_id, since, until=until, limit=limit)
+        if rows is not None:
+            return jsonify({"rows": rows, "next_cursor": None})
+
+    try:
+        # One extra row tells us whether another page exists
+        router = get_shard_router()
+        conn = router.connection_for(device_id) if router is not None else get_read_db()
+        rows = fetch_history(conn, device_id, since=since, until=until, after=after, limit=limit + 1)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1])
+    # Same row shape as the in-memory answer above: the id only lives in the cursor
+    rows = [{k: v for k, v in row.items() if k != 'id'} for row in rows]
+    return jsonify({"rows": rows, "next_cursor": next_cursor})
+
+
+@app.route('/api/v1/sensor/rollups', methods=['GET'])
+def sensor_rollups():
+    """Pre-aggregated minute/hour buckets (requires ROLLUPS=1 on the writers).
+
+    Query params: granularity (minute|hour, default hour), device_id, since, until.
+    """
+    granularity = request.args.get('granularity') or 'hour'
+    if granularity not in ('minute', 'hour'):
+        return jsonify({"error": "granularity must be 'minute' or 'hour'"}), 400
+    try:
+        since = _query_time('since')
+        until = _query_time('until')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    device_id = request.args.get('device_id')
+    try:
+        router = get_shard_router()
+        if router is None or device_id:
+            conn = router.connection_for(device_id) if router is not None else get_read_db()
+            rows = fetch_rollups(conn, granularity, device_id=device_id, since=since, until=until)
+        else:
+            rows = [row for part in router.scatter(fetch_rollups, granularity, since=since, until=until)
+                    for row in part]
+            rows.sort(key=lambda r: (r['bucket'], r['device_id']))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(rows)
+
+
+@app.route('/api/v1/sensor/stats', methods=['GET'])
+def sensor_stats():
+    """Aggregates over one device's readings: count, LDR avg/min/max, water/buzzer-on counts, first/last ts.
+
+    Query params: device_id (required), since, until (ISO timestamps, until is exclusive).
+    """
+    device_id = request.args.get('device_id')
+    if not device_id:
+        return jsonify({"error": "device_id is required"}), 400
+    try:
+        since = _query_time('since')
+        until = _query_time('until')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    store = get_hot_store()
+    if store is not None and since is not None:
+        result = store.stats(device_id, since, until=until)
+        if result is not None:
+            return jsonify(result)
+    try:
+        router = get_shard_router()
+        conn = router.connection_for(device_id) if router is not None else get_read_db()
+        return jsonify(fetch_window_stats(conn, device_id, since=since, until=until))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/v1/ingest/stats', methods=['GET'])
+def ingest_stats():
+    """Counters for the caches, DB pools, shards, rate limiting, dedup, write-behind and spool."""
+    stats = {}
+    cache = get_latest_cache()
+    if cache is not None:
+        stats['latest_cache'] = cache.info()
+    store = get_hot_store()
+    if store is not None:
+        stats['hot_store'] = store.info()
+    if db.pool is not None:
+        stats['db_pool'] = db.pool.info()
+    if db.read_router is not None:
+        stats['read_router'] = db.read_router.info()
+    if db.shard_router is not None:
+        stats['shards'] = db.shard_router.info()
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        stats['rate_limit'] = limiter.info()
+    dedup = get_dedup_cache()
+    if dedup is not None:
+        stats['dedup'] = dedup.info()
+    buffer = get_write_buffer(on_error=_spool_failed_batch)
+    if buffer is not None:
+        stats['write_behind'] = dict(buffer.stats, depth=buffer.depth())
+    spool = get_spool()
+    if spool is not None:
+        stats['spool'] = spool.info()
+    return jsonify(stats)
+
+
 @app.route('/api/v1/csv', methods=['GET'])
 def csv_data():
     """Read local sensorWater.csv (semicolon-separated) and return JSON.
@@ -73,28 +463,8 @@ def csv_data():
     if not os.path.exists(csv_path):
         return jsonify({'error': 'CSV not found'}), 404
 
-    rows = []
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f, delimiter=';')
-        for r in reader:
-            # normalize/convert types
-            try:
-                r['Time(s)'] = int(r.get('Time(s)', '') or 0)
-            except Exception:
-                r['Time(s)'] = None
-            try:
-                r['WaterLevel'] = int(r.get('WaterLevel', '') or 0)
-            except Exception:
-                r['WaterLevel'] = None
-            # keep other fields as-is
-            rows.append(r)
-            if len(rows) >= limit:
-                break
-
-    if status_filter:
-        rows = [r for r in rows if r.get('Status') == status_filter]
-
-    return jsonify(rows)
+    # Parsed once per file version; the status filter is applied before the limit
+    return jsonify(get_csv_cache(csv_path).query(status=status_filter, limit=limit))
 
 
 @app.route('/dashboard')
@@ -102,5 +472,10 @@ def dashboard():
     return render_template('dashboard.html')
 
 if __name__ == '__main__':
+    # The write-behind buffer may first start on a request thread, where no signal handler can be set
+    db.exit_on_sigterm()
+    # Warm the last-value cache and hot tier before taking traffic (no-ops unless enabled)
+    get_latest_cache()
+    get_hot_store()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
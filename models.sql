@@ -11,3 +11,27 @@ CREATE TABLE IF NOT EXISTS sensor_readings (
   ts DATETIME NOT NULL,
   INDEX idx_device_ts (device_id, ts)
 );
+
+-- Optional: durable duplicate suppression for device retransmits.
+-- Enable together with DB_INSERT_IGNORE=1 so duplicate rows are skipped rather than failing the batch.
+-- Remove existing duplicates first, otherwise the ALTER fails.
+-- ALTER TABLE sensor_readings ADD UNIQUE KEY uq_device_ts (device_id, ts);
+
+-- Per-device minute/hour rollups, maintained on ingest and bulk import when ROLLUPS=1
+-- (rebuild with: python rollups.py --backfill). avg LDR = ldr_sum / ldr_count.
+CREATE TABLE IF NOT EXISTS sensor_rollup_minute (
+  device_id VARCHAR(64) NOT NULL,
+  bucket DATETIME NOT NULL,
+  cnt INT NOT NULL,
+  ldr_count INT NOT NULL,
+  ldr_sum BIGINT NOT NULL,
+  ldr_min INT NULL,
+  ldr_max INT NULL,
+  water_on INT NOT NULL,
+  buzzer_on INT NOT NULL,
+  first_ts DATETIME NOT NULL,
+  last_ts DATETIME NOT NULL,
+  PRIMARY KEY (device_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS sensor_rollup_hour LIKE sensor_rollup_minute;
@@ -0,0 +1,27 @@
+-- Optional time-partitioned layout for sensor_readings (MySQL 8 / MariaDB 10.x).
+-- Use instead of the sensor_readings definition in models.sql, then pre-create partitions with:
+--   python partitions.py --ensure 3
+-- Range partitioning on ts lets MySQL prune partitions for queries with ts bounds
+-- (history pages, rollup backfills, retention counts), and lets retention drop a whole
+-- partition instead of deleting rows (see partitions.py / retention.py).
+USE iot_sensors;
+
+-- Every unique key must include the partitioning column, so the primary key becomes (id, ts).
+CREATE TABLE IF NOT EXISTS sensor_readings (
+  id BIGINT AUTO_INCREMENT,
+  device_id VARCHAR(64) NOT NULL,
+  ldr INT NULL,
+  water TINYINT(1) NULL,
+  buzzer TINYINT(1) NULL,
+  ts DATETIME NOT NULL,
+  PRIMARY KEY (id, ts),
+  INDEX idx_device_ts (device_id, ts)
+)
+PARTITION BY RANGE COLUMNS (ts) (
+  PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- Migrating an existing unpartitioned table (rewrites the table; run in a maintenance window):
+-- ALTER TABLE sensor_readings DROP PRIMARY KEY, ADD PRIMARY KEY (id, ts);
+-- ALTER TABLE sensor_readings PARTITION BY RANGE COLUMNS (ts) (PARTITION pmax VALUES LESS THAN (MAXVALUE));
+-- The optional uq_device_ts unique key from models.sql already contains ts and stays valid.
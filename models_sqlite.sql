@@ -0,0 +1,48 @@
+-- SQLite version of models.sql for DB_BACKEND=sqlite (applied automatically on first connect).
+-- Same tables, columns and indexes as models.sql, plus idx_ts for the fleet-wide newest-first
+-- /latest query and the hot-store warm-up scan. ts columns are stored as 'YYYY-MM-DD HH:MM:SS' UTC text.
+
+CREATE TABLE IF NOT EXISTS sensor_readings (
+  id INTEGER PRIMARY KEY,
+  device_id VARCHAR(64) NOT NULL,
+  ldr INT NULL,
+  water TINYINT NULL,
+  buzzer TINYINT NULL,
+  ts DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_device_ts ON sensor_readings (device_id, ts);
+CREATE INDEX IF NOT EXISTS idx_ts ON sensor_readings (ts);
+
+-- Optional durable duplicate suppression, as in models.sql (pair with DB_INSERT_IGNORE=1):
+-- CREATE UNIQUE INDEX uq_device_ts ON sensor_readings (device_id, ts);
+
+-- ldr_sum is REAL so ldr_sum / ldr_count is a true division, as in MySQL
+CREATE TABLE IF NOT EXISTS sensor_rollup_minute (
+  device_id VARCHAR(64) NOT NULL,
+  bucket DATETIME NOT NULL,
+  cnt INT NOT NULL,
+  ldr_count INT NOT NULL,
+  ldr_sum REAL NOT NULL,
+  ldr_min INT NULL,
+  ldr_max INT NULL,
+  water_on INT NOT NULL,
+  buzzer_on INT NOT NULL,
+  first_ts DATETIME NOT NULL,
+  last_ts DATETIME NOT NULL,
+  PRIMARY KEY (device_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS sensor_rollup_hour (
+  device_id VARCHAR(64) NOT NULL,
+  bucket DATETIME NOT NULL,
+  cnt INT NOT NULL,
+  ldr_count INT NOT NULL,
+  ldr_sum REAL NOT NULL,
+  ldr_min INT NULL,
+  ldr_max INT NULL,
+  water_on INT NOT NULL,
+  buzzer_on INT NOT NULL,
+  first_ts DATETIME NOT NULL,
+  last_ts DATETIME NOT NULL,
+  PRIMARY KEY (device_id, bucket)
+);
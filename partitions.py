@@ -0,0 +1,161 @@
+"""
+Partition management for the time-partitioned sensor_readings layout
+(models_partitioned.sql).
+
+Partitions are named p<YYYYMMDD> (PARTITION_GRANULARITY=day) or p<YYYYMM>
+(month, default) and hold rows with ts below the start of the next period;
+`pmax` catches anything beyond the last pre-created partition. With DB_SHARDS
+set, every command runs on each shard in turn.
+
+Usage:
+  python partitions.py --list
+  python partitions.py --ensure 3                 # pre-create the next 3 periods
+  python partitions.py --drop-before 2025-01-01   # downsample + drop older partitions
+  python partitions.py --drop-before 2025-01-01 --dry-run
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from db import get_db, databases
+import rollups
+
+MAXVALUE_PARTITION = 'pmax'
+
+
+def granularity():
+    return os.environ.get('PARTITION_GRANULARITY', 'month')
+
+
+def _period_start(ts, unit):
+    if unit == 'day':
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_period(start, unit):
+    if unit == 'day':
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _name(start, unit):
+    return start.strftime('p%Y%m%d' if unit == 'day' else 'p%Y%m')
+
+
+def list_partitions(conn):
+    """Return [(name, upper_bound or None for MAXVALUE, approx_rows)] in partition order."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'sensor_readings' AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        )
+        partitions = []
+        for name, description, rows in cursor.fetchall():
+            bound = None
+            if description and description.upper() != 'MAXVALUE':
+                bound = datetime.fromisoformat(description.strip("'"))
+            partitions.append((name, bound, rows))
+        return partitions
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def is_partitioned(connect=get_db):
+    return bool(list_partitions(connect()))
+
+
+def ensure(ahead=3, now=None, connect=get_db):
+    """Split pmax so partitions exist up to `ahead` periods after the current one."""
+    unit = granularity()
+    existing = list_partitions(connect())
+    bounds = [bound for _, bound, _ in existing if bound is not None]
+    start = _period_start(now or datetime.utcnow(), unit)
+    last_bound = max(bounds) if bounds else start
+    wanted = []
+    period = start
+    for _ in range(ahead + 1):
+        upper = _next_period(period, unit)
+        if upper > last_bound:
+            wanted.append((_name(period, unit), upper))
+        period = upper
+    if not wanted:
+        print("✅ Partitions already cover the requested range")
+        return []
+    parts = ", ".join(f"PARTITION {name} VALUES LESS THAN ('{upper:%Y-%m-%d %H:%M:%S}')" for name, upper in wanted)
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"ALTER TABLE sensor_readings REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO "
+            f"({parts}, PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE))"
+        )
+    finally:
+        cursor.close()
+        conn.close()
+    for name, upper in wanted:
+        print(f"➕ {name} (< {upper:%Y-%m-%d})")
+    return [name for name, _ in wanted]
+
+
+def drop_before(cutoff, downsample=True, dry_run=False, connect=get_db):
+    """Drop partitions whose rows are all older than `cutoff`. Returns dropped names.
+
+    With `downsample`, each partition's hour buckets are first rebuilt in
+    sensor_rollup_hour (read with partition selection, so only that partition is
+    scanned): delete, then insert, in one transaction. If the DROP then fails,
+    the next run rebuilds the same buckets instead of counting them twice.
+    Per device, buckets before its oldest row in the partition are left alone:
+    retention.py already downsampled and deleted those rows.
+    """
+    expired = [(name, bound, rows) for name, bound, rows in list_partitions(connect())
+               if bound is not None and bound <= cutoff]
+    dropped = []
+    for name, bound, rows in expired:
+        if dry_run:
+            print(f"🔍 would drop {name} (~{rows} rows)")
+            continue
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            if downsample:
+                cursor.execute(f"SELECT device_id, MIN(ts) FROM sensor_readings PARTITION ({name}) GROUP BY device_id")
+                for device_id, first_ts in cursor.fetchall():
+                    cursor.execute(
+                        "DELETE FROM sensor_rollup_hour WHERE device_id = %s AND bucket >= %s AND bucket < %s",
+                        (device_id, rollups.bucket_start(first_ts, 'hour'), bound)
+                    )
+                cursor.execute(
+                    rollups.BACKFILL_SQL.format(table='sensor_rollup_hour', fmt=rollups.BUCKET_FORMATS['hour'],
+                                                partition=f"PARTITION ({name})", where="")
+                )
+                conn.commit()
+            cursor.execute(f"ALTER TABLE sensor_readings DROP PARTITION {name}")
+        finally:
+            cursor.close()
+            conn.close()
+        print(f"🗑️  dropped {name} (~{rows} rows)")
+        dropped.append(name)
+    return dropped
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not {'--list', '--ensure', '--drop-before'} & set(args):
+        print(__doc__)
+        sys.exit(0)
+    targets = databases()
+    for db_name, connect in targets.items():
+        if len(targets) > 1:
+            print(f"📦 Shard {db_name}")
+        if '--list' in args:
+            for name, bound, rows in list_partitions(connect()):
+                print(f"  {name:<12} < {bound or 'MAXVALUE'}  ~{rows} rows")
+        elif '--ensure' in args:
+            ensure(int(args[args.index('--ensure') + 1]), connect=connect)
+        else:
+            cutoff = datetime.fromisoformat(args[args.index('--drop-before') + 1])
+            drop_before(cutoff, downsample=not rollups.enabled(), dry_run='--dry-run' in args, connect=connect)
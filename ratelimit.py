@@ -0,0 +1,96 @@
+"""Per-device token buckets and a global concurrency cap for ingest endpoints.
+
+Each device refills `rate` tokens per second up to `burst`; a reading costs
+one token. Independently, at most `max_concurrent` non-critical ingest
+requests may be in flight. Both checks are O(1) and never block, so shed
+requests get an immediate 429. Critical readings (buzzer=1, i.e. the tank is
+in CRITICAL state) bypass both.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def is_critical(row):
+    """Critical readings are never shed: the buzzer only fires on CRITICAL water levels."""
+    return row[3] == 1
+
+
+class RateLimiter:
+    def __init__(self, rate=5.0, burst=20, max_concurrent=4, max_devices=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_devices = max_devices
+        self._buckets = OrderedDict()  # device_id -> [tokens, last_refill]
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats = {'allowed': 0, 'shed_rate': 0, 'shed_busy': 0, 'critical': 0}
+
+    def allow(self, device_id, critical=False):
+        """Take one token from the device's bucket. Returns False if it is empty."""
+        now = time.monotonic()
+        with self._lock:
+            if critical:
+                self.stats['critical'] += 1
+                return True
+            bucket = self._buckets.get(device_id)
+            if bucket is None:
+                bucket = self._buckets[device_id] = [float(self.burst), now]
+                if len(self._buckets) > self.max_devices:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(device_id)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                self.stats['shed_rate'] += 1
+                return False
+            bucket[0] -= 1
+            self.stats['allowed'] += 1
+            return True
+
+    @contextmanager
+    def slot(self, critical=False):
+        """Hold one of `max_concurrent` ingest slots; yields False if none is free."""
+        if critical:
+            yield True
+            return
+        with self._lock:
+            admitted = self._in_flight < self.max_concurrent
+            if admitted:
+                self._in_flight += 1
+            else:
+                self.stats['shed_busy'] += 1
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._lock:
+                    self._in_flight -= 1
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, in_flight=self._in_flight, devices=len(self._buckets))
+
+
+rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Return the shared RateLimiter, or None unless INGEST_RATE_LIMIT is enabled."""
+    global rate_limiter
+    if os.environ.get('INGEST_RATE_LIMIT', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _rate_limiter_lock:
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(
+                rate=float(os.environ.get('INGEST_RATE_PER_DEVICE', 5)),
+                burst=int(os.environ.get('INGEST_RATE_BURST', 20)),
+                # Default leaves one pooled connection free for reads
+                max_concurrent=int(os.environ.get('INGEST_MAX_CONCURRENT',
+                                                  max(1, int(os.environ.get('DB_POOL_SIZE', 5)) - 1))),
+            )
+        return rate_limiter
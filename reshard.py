@@ -0,0 +1,195 @@
+"""
+Move devices between the shards configured in DB_SHARDS.
+
+A move copies the device's rows to the target shard in id order, pins the
+device there in DB_SHARD_OVERRIDES (or unpins it when the target is its
+consistent-hash owner), copies whatever the source received meanwhile, and
+then deletes the copied source rows (only those, by id). With ROLLUPS=1 the
+device's rollup rows follow it: buckets covered by raw rows are rebuilt on the
+target, older ones (downsampled by retention.py) are copied, and the source's
+are deleted so fleet-wide rollups count each bucket once. Restart or reload the
+app after moving so its router picks up the new placement, then run --sweep to
+carry over rows that app processes still using the old placement wrote to the
+source in the meantime.
+
+Usage:
+  python reshard.py --where esp01               # which shard owns a device
+  python reshard.py --move esp01 --to s1        # pin a device to a shard
+  python reshard.py --rebalance [--dry-run]     # move unpinned devices to their ring owner (after adding a shard)
+  python reshard.py --sweep [--dry-run]         # after a restart: move rows left on shards that no longer own them
+"""
+import os
+import sys
+import json
+from datetime import datetime
+
+import rollups
+from db import get_shard_router, insert_readings
+
+ROLLUP_COLUMNS = "device_id, bucket, cnt, ldr_count, ldr_sum, ldr_min, ldr_max, water_on, buzzer_on, first_ts, last_ts"
+
+
+def save_overrides(overrides):
+    path = os.environ.get('DB_SHARD_OVERRIDES', 'shard_overrides.json')
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(overrides, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def devices_on(router, name):
+    conn = router.connection(name)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT device_id FROM sensor_readings")
+        return [r[0] for r in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def copy_rows(router, device_id, source, target, after_id=0, batch_size=5000):
+    """Copy a device's rows with id > after_id from source to target. Returns (rows copied, last id)."""
+    copied = 0
+    while True:
+        conn = router.connection(source)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT id, device_id, ldr, water, buzzer, ts FROM sensor_readings "
+                "WHERE device_id = %s AND id > %s ORDER BY id LIMIT %s",
+                (device_id, after_id, batch_size)
+            )
+            batch = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        if not batch:
+            return copied, after_id
+        insert_readings(router.connection(target), [tuple(r[1:]) for r in batch])
+        copied += len(batch)
+        after_id = batch[-1][0]
+        print(f"  {device_id}: copied {copied} rows", end='\r')
+
+
+def delete_copied(router, device_id, source, last_id):
+    """Delete a device's rows with id <= last_id from source; later rows have not been copied yet."""
+    conn = router.connection(source)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM sensor_readings WHERE device_id = %s AND id <= %s", (device_id, last_id))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def move_rollups(router, device_id, source, target):
+    """Rebuild the device's rollups on target, copy the buckets raw rows no longer cover, drop the source's."""
+    rollups.backfill(router.connection(target), device_id)
+    src = router.connection(source)
+    dst = router.connection(target)
+    src_cursor = src.cursor()
+    dst_cursor = dst.cursor()
+    try:
+        dst_cursor.execute("SELECT MIN(ts) FROM sensor_readings WHERE device_id = %s", (device_id,))
+        first_ts = dst_cursor.fetchone()[0]
+        if isinstance(first_ts, str):
+            first_ts = datetime.fromisoformat(first_ts)
+        for granularity, table in rollups.GRANULARITIES.items():
+            where, params = "device_id = %s", (device_id,)
+            if first_ts is not None:
+                where, params = where + " AND bucket < %s", params + (rollups.bucket_start(first_ts, granularity),)
+            dst_cursor.execute(f"SELECT bucket FROM {table} WHERE {where}", params)
+            # Buckets the target already has came from an earlier move: copying them again would double count
+            present = {r[0] for r in dst_cursor.fetchall()}
+            src_cursor.execute(f"SELECT {ROLLUP_COLUMNS} FROM {table} WHERE {where}", params)
+            missing = [tuple(r) for r in src_cursor.fetchall() if r[1] not in present]
+            if missing:
+                dst_cursor.executemany(f"INSERT INTO {table} ({ROLLUP_COLUMNS}) VALUES ({', '.join(['%s'] * 11)})",
+                                       missing)
+        dst.commit()
+        for table in rollups.GRANULARITIES.values():
+            src_cursor.execute(f"DELETE FROM {table} WHERE device_id = %s", (device_id,))
+        src.commit()
+    finally:
+        src_cursor.close()
+        dst_cursor.close()
+        src.close()
+        dst.close()
+
+
+def move(router, device_id, target, source=None):
+    """Move a device's rows to `target`. `source` defaults to where the router places it today."""
+    source = source or router.shard_for(device_id)
+    if source == target:
+        return 0
+    copied, last_id = copy_rows(router, device_id, source, target)
+    if target == router.ring.node_for(device_id):
+        router.overrides.pop(device_id, None)
+    else:
+        router.overrides[device_id] = target
+    save_overrides(router.overrides)
+    # Rows that landed on the source while the bulk copy ran
+    tail, last_id = copy_rows(router, device_id, source, target, after_id=last_id)
+    delete_copied(router, device_id, source, last_id)
+    if rollups.enabled():
+        move_rollups(router, device_id, source, target)
+    return copied + tail
+
+
+def sweep(router, dry_run=False):
+    """Move rows stored on a shard that does not own their device to the owner. Returns rows moved."""
+    moved = 0
+    for name in router.names:
+        for device in devices_on(router, name):
+            owner = router.shard_for(device)
+            if owner == name:
+                continue
+            if dry_run:
+                print(f"🔍 {device}: rows left on {name}, would move them to {owner}")
+                continue
+            copied, last_id = copy_rows(router, device, name, owner)
+            delete_copied(router, device, name, last_id)
+            if rollups.enabled():
+                move_rollups(router, device, name, owner)
+            print(f"🧹 {device}: moved {copied} leftover rows {name} -> {owner}")
+            moved += copied
+    return moved
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    router = get_shard_router()
+    if router is None:
+        print("❌ DB_SHARDS is not set")
+        sys.exit(1)
+    if '--where' in args:
+        device = args[args.index('--where') + 1]
+        pinned = " (pinned)" if device in router.overrides else ""
+        print(f"{device} -> {router.shard_for(device)}{pinned}")
+    elif '--move' in args and '--to' in args:
+        device = args[args.index('--move') + 1]
+        target = args[args.index('--to') + 1]
+        if target not in router.names:
+            print(f"❌ Unknown shard {target}; configured: {', '.join(router.names)}")
+            sys.exit(1)
+        source = router.shard_for(device)
+        moved = move(router, device, target)
+        print(f"🚚 {device}: moved {moved} rows {source} -> {target}")
+    elif '--rebalance' in args:
+        dry_run = '--dry-run' in args
+        for name in router.names:
+            for device in devices_on(router, name):
+                owner = router.ring.node_for(device)
+                if device in router.overrides or owner == name:
+                    continue
+                if dry_run:
+                    print(f"🔍 {device}: would move {name} -> {owner}")
+                else:
+                    print(f"🚚 {device}: moved {move(router, device, owner, source=name)} rows {name} -> {owner}")
+    elif '--sweep' in args:
+        moved = sweep(router, dry_run='--dry-run' in args)
+        print(f"✅ Sweep complete ({moved} rows moved)")
+    else:
+        print(__doc__)
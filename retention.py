@@ -0,0 +1,162 @@
+"""
+Retention and downsampling for sensor_readings.
+
+Raw rows older than the retention window are downsampled into the hourly
+rollup table (see rollups.py) and deleted in small chunks, each in its own
+short transaction with a pause in between, so live inserts are never blocked
+behind one long-running DELETE. On the partitioned layout
+(models_partitioned.sql), partitions expired for every device are dropped
+outright first.
+
+Configuration:
+  RETENTION_DAYS=90                         default raw retention
+  RETENTION_OVERRIDES=esp01:365,csv_import:7   per-device retention in days
+  RETENTION_CHUNK=5000                      rows deleted per transaction
+  RETENTION_PAUSE_MS=200                    sleep between chunks
+
+With DB_SHARDS set, each shard is planned and pruned in turn.
+
+Usage:
+  python retention.py --dry-run             # report what would be pruned
+  python retention.py                       # downsample + prune
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db import get_db, databases
+import rollups
+import partitions
+
+
+def retention_policy():
+    """Return (default_days, {device_id: days}) from the environment."""
+    default_days = int(os.environ.get('RETENTION_DAYS', 90))
+    overrides = {}
+    for item in os.environ.get('RETENTION_OVERRIDES', '').split(','):
+        if ':' in item:
+            device_id, days = item.rsplit(':', 1)
+            overrides[device_id.strip()] = int(days)
+    return default_days, overrides
+
+
+def _devices(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT device_id FROM sensor_readings")
+        return [r[0] for r in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def plan(now=None, connect=get_db):
+    """List (device_id, cutoff, expired_rows, oldest_ts) for every device with expired raw data."""
+    now = now or datetime.utcnow()
+    default_days, overrides = retention_policy()
+    report = []
+    for device_id in _devices(connect()):
+        # Whole hours only, so an hourly bucket is never half raw, half downsampled
+        cutoff = (now - timedelta(days=overrides.get(device_id, default_days))).replace(
+            minute=0, second=0, microsecond=0)
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT COUNT(*), MIN(ts) FROM sensor_readings WHERE device_id = %s AND ts < %s",
+                (device_id, cutoff)
+            )
+            expired, oldest = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+        if expired:
+            report.append((device_id, cutoff, expired, oldest))
+    return report
+
+
+def prune(device_id, cutoff, chunk=5000, pause=0.2, downsample=True, connect=get_db):
+    """Delete expired raw rows in primary-key chunks. Returns rows deleted.
+
+    With `downsample`, each chunk is merged into sensor_rollup_hour in the same
+    transaction that deletes it, so an interrupted run never loses or
+    double-counts rows. Skip it when ROLLUPS=1 already maintains the buckets.
+    """
+    deleted = 0
+    rollup_sql = rollups.BACKFILL_SQL.format(
+        table='sensor_rollup_hour', fmt=rollups.BUCKET_FORMATS['hour'], partition='',
+        where="WHERE id IN ({ids})"
+    ) + rollups.MERGE_SQL
+    while True:
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            # idx_device_ts finds the chunk; working by id keeps each transaction's lock footprint small
+            cursor.execute(
+                "SELECT id FROM sensor_readings WHERE device_id = %s AND ts < %s ORDER BY ts LIMIT %s",
+                (device_id, cutoff, chunk)
+            )
+            ids = tuple(r[0] for r in cursor.fetchall())
+            if not ids:
+                return deleted
+            placeholders = ",".join(["%s"] * len(ids))
+            if downsample:
+                cursor.execute(rollup_sql.replace("{ids}", placeholders), ids)
+            cursor.execute("DELETE FROM sensor_readings WHERE id IN (" + placeholders + ")", ids)
+            conn.commit()
+            deleted += cursor.rowcount
+        finally:
+            cursor.close()
+            conn.close()
+        print(f"  {device_id}: deleted {deleted} rows", end='\r')
+        if len(ids) < chunk:
+            return deleted
+        time.sleep(pause)
+
+
+def partition_cutoff(now=None):
+    """Oldest cutoff across all policies: partitions below it are expired for every device."""
+    now = now or datetime.utcnow()
+    default_days, overrides = retention_policy()
+    return now - timedelta(days=max([default_days] + list(overrides.values())))
+
+
+def run(dry_run=False):
+    targets = databases()
+    for name, connect in targets.items():
+        if len(targets) > 1:
+            print(f"\n📦 Shard {name}")
+        run_on(connect, dry_run=dry_run)
+
+
+def run_on(connect, dry_run=False):
+    chunk = int(os.environ.get('RETENTION_CHUNK', 5000))
+    pause = int(os.environ.get('RETENTION_PAUSE_MS', 200)) / 1000.0
+    if partitions.is_partitioned(connect):
+        # Whole partitions go with a metadata-only DROP; the chunked pass below handles the rest
+        partitions.drop_before(partition_cutoff(), downsample=not rollups.enabled(), dry_run=dry_run,
+                               connect=connect)
+    report = plan(connect=connect)
+    if not report:
+        print("✅ Nothing to prune")
+        return
+    print(f"{'Device':<20} {'Cutoff':<20} {'Expired rows':>12}  Oldest")
+    print("-" * 80)
+    for device_id, cutoff, expired, oldest in report:
+        print(f"{device_id:<20} {cutoff:%Y-%m-%d %H:%M:%S}  {expired:>12}  {oldest}")
+    print(f"\nTotal: {sum(r[2] for r in report)} rows across {len(report)} devices")
+    if dry_run:
+        print("🔍 Dry run: nothing deleted")
+        return
+    for device_id, cutoff, expired, oldest in report:
+        deleted = prune(device_id, cutoff, chunk=chunk, pause=pause, downsample=not rollups.enabled(),
+                        connect=connect)
+        print(f"🗑️  {device_id}: deleted {deleted} raw rows older than {cutoff:%Y-%m-%d}")
+
+
+if __name__ == "__main__":
+    if '--help' in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+    run(dry_run='--dry-run' in sys.argv)
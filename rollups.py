@@ -0,0 +1,204 @@
+"""
+Per-device minute and hour rollups of sensor_readings.
+
+Tables sensor_rollup_minute / sensor_rollup_hour (see models.sql) hold one row
+per device per bucket with reading count, LDR sum/min/max (avg = ldr_sum /
+ldr_count), water-detected count, buzzer-on count and first/last ts. They are
+maintained incrementally: each inserted batch is aggregated in Python and
+merged with one INSERT ... ON DUPLICATE KEY UPDATE per table, inside the same
+transaction as the raw insert. Enable with ROLLUPS=1.
+
+With DB_INSERT_IGNORE=1 an insert may skip retransmitted rows. When it wrote
+fewer rows than it was given, the buckets the batch touches are rebuilt from
+sensor_readings (delete, then re-aggregate) instead, so skipped duplicates are
+not counted twice.
+
+Backfill (rebuild from raw rows; buckets older than a device's oldest raw row,
+e.g. downsampled by retention.py, are kept):
+  python rollups.py --backfill                  # all devices
+  python rollups.py --backfill --device esp01
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+GRANULARITIES = {
+    'minute': 'sensor_rollup_minute',
+    'hour': 'sensor_rollup_hour',
+}
+
+MERGE_SQL = """
+    ON DUPLICATE KEY UPDATE
+        cnt = cnt + VALUES(cnt),
+        ldr_count = ldr_count + VALUES(ldr_count),
+        ldr_sum = ldr_sum + VALUES(ldr_sum),
+        ldr_min = LEAST(COALESCE(ldr_min, VALUES(ldr_min)), COALESCE(VALUES(ldr_min), ldr_min)),
+        ldr_max = GREATEST(COALESCE(ldr_max, VALUES(ldr_max)), COALESCE(VALUES(ldr_max), ldr_max)),
+        water_on = water_on + VALUES(water_on),
+        buzzer_on = buzzer_on + VALUES(buzzer_on),
+        first_ts = LEAST(first_ts, VALUES(first_ts)),
+        last_ts = GREATEST(last_ts, VALUES(last_ts))
+"""
+
+# MERGE_SQL for the SQLite backend (sqlite_backend.py swaps it in when translating queries)
+SQLITE_MERGE_SQL = """
+    ON CONFLICT (device_id, bucket) DO UPDATE SET
+        cnt = cnt + excluded.cnt,
+        ldr_count = ldr_count + excluded.ldr_count,
+        ldr_sum = ldr_sum + excluded.ldr_sum,
+        ldr_min = MIN(COALESCE(ldr_min, excluded.ldr_min), COALESCE(excluded.ldr_min, ldr_min)),
+        ldr_max = MAX(COALESCE(ldr_max, excluded.ldr_max), COALESCE(excluded.ldr_max, ldr_max)),
+        water_on = water_on + excluded.water_on,
+        buzzer_on = buzzer_on + excluded.buzzer_on,
+        first_ts = MIN(first_ts, excluded.first_ts),
+        last_ts = MAX(last_ts, excluded.last_ts)
+"""
+
+UPSERT_SQL = """
+    INSERT INTO {table}
+        (device_id, bucket, cnt, ldr_count, ldr_sum, ldr_min, ldr_max, water_on, buzzer_on, first_ts, last_ts)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+""" + MERGE_SQL
+
+BACKFILL_SQL = """
+    INSERT INTO {table}
+        (device_id, bucket, cnt, ldr_count, ldr_sum, ldr_min, ldr_max, water_on, buzzer_on, first_ts, last_ts)
+    SELECT device_id, DATE_FORMAT(ts, '{fmt}') AS bucket, COUNT(*), COUNT(ldr), COALESCE(SUM(ldr), 0),
+           MIN(ldr), MAX(ldr), COALESCE(SUM(water = 1), 0), COALESCE(SUM(buzzer = 1), 0), MIN(ts), MAX(ts)
+    FROM sensor_readings {partition}
+    {where}
+    GROUP BY device_id, bucket
+"""
+
+BUCKET_FORMATS = {
+    'minute': '%Y-%m-%d %H:%i:00',
+    'hour': '%Y-%m-%d %H:00:00',
+}
+
+# strftime equivalents of BUCKET_FORMATS for the SQLite backend
+SQLITE_BUCKET_FORMATS = {
+    'minute': '%Y-%m-%d %H:%M:00',
+    'hour': '%Y-%m-%d %H:00:00',
+}
+
+BUCKET_STEPS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+}
+
+
+def enabled():
+    return os.environ.get('ROLLUPS', '0').lower() in ('1', 'true', 'yes')
+
+
+def bucket_start(ts, granularity):
+    if granularity == 'minute':
+        return ts.replace(second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def aggregate(rows, granularity):
+    """Fold (device_id, ldr, water, buzzer, ts) tuples into per-(device, bucket) rollup rows.
+
+    `ts` must already be naive UTC with whole seconds (ingest.parse_timestamp),
+    so a row is counted in the bucket it is stored in. Rows come back sorted by
+    (device_id, bucket): concurrent upserts then lock rollup rows in the same
+    order and cannot deadlock each other.
+    """
+    buckets = {}
+    for device_id, ldr, water, buzzer, ts in rows:
+        bucket = bucket_start(ts, granularity)
+        agg = buckets.get((device_id, bucket))
+        if agg is None:
+            agg = buckets[(device_id, bucket)] = [0, 0, 0, None, None, 0, 0, ts, ts]
+        agg[0] += 1
+        if ldr is not None:
+            agg[1] += 1
+            agg[2] += ldr
+            agg[3] = ldr if agg[3] is None else min(agg[3], ldr)
+            agg[4] = ldr if agg[4] is None else max(agg[4], ldr)
+        agg[5] += water == 1
+        agg[6] += buzzer == 1
+        agg[7] = min(agg[7], ts)
+        agg[8] = max(agg[8], ts)
+    return [(device_id, bucket, *agg) for (device_id, bucket), agg in sorted(buckets.items())]
+
+
+def spans(rows, into=None):
+    """{device_id: (first ts, last ts)} of the rows, extending `into` if given."""
+    spans = {} if into is None else into
+    for device_id, _, _, _, ts in rows:
+        first, last = spans.get(device_id, (ts, ts))
+        spans[device_id] = (min(first, ts), max(last, ts))
+    return spans
+
+
+def rebuild_statements(spans):
+    """(sql, params) pairs that recompute every bucket overlapping each device's span from raw rows."""
+    statements = []
+    for device_id, (first, last) in spans.items():
+        for granularity, table in GRANULARITIES.items():
+            start = bucket_start(first, granularity)
+            end = bucket_start(last, granularity) + BUCKET_STEPS[granularity]
+            params = (device_id, start, end)
+            statements.append((f"DELETE FROM {table} WHERE device_id = %s AND bucket >= %s AND bucket < %s", params))
+            statements.append((BACKFILL_SQL.format(table=table, fmt=BUCKET_FORMATS[granularity], partition='',
+                                                   where="WHERE device_id = %s AND ts >= %s AND ts < %s"), params))
+    return statements
+
+
+def apply(cursor, rows, inserted=None):
+    """Merge a batch of raw rows into both rollup tables using the caller's transaction.
+
+    `inserted` is how many of the rows the raw INSERT wrote; when INSERT IGNORE
+    skipped some, the touched buckets are rebuilt from raw rows instead.
+    """
+    if inserted is not None and inserted < len(rows):
+        for sql, params in rebuild_statements(spans(rows)):
+            cursor.execute(sql, params)
+        return
+    for granularity, table in GRANULARITIES.items():
+        cursor.executemany(UPSERT_SQL.format(table=table), aggregate(rows, granularity))
+
+
+def backfill(conn, device_id=None):
+    """Rebuild rollups from sensor_readings (for one device, or all of them).
+
+    Only buckets from each device's oldest remaining raw row onwards are
+    replaced. Older buckets may hold history that retention downsampled before
+    deleting its raw rows, so they are kept.
+    """
+    cursor = conn.cursor()
+    try:
+        where, params = ("WHERE device_id = %s", (device_id,)) if device_id else ("", ())
+        cursor.execute(f"SELECT device_id, MIN(ts) FROM sensor_readings {where} GROUP BY device_id", params)
+        oldest = [(device, ts if isinstance(ts, datetime) else datetime.fromisoformat(ts))
+                  for device, ts in cursor.fetchall()]
+        for granularity, table in GRANULARITIES.items():
+            for device, first_ts in oldest:
+                cursor.execute(f"DELETE FROM {table} WHERE device_id = %s AND bucket >= %s",
+                               (device, bucket_start(first_ts, granularity)))
+            cursor.execute(BACKFILL_SQL.format(table=table, fmt=BUCKET_FORMATS[granularity],
+                                               partition='', where=where), params)
+            print(f"  {table}: {cursor.rowcount} buckets")
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    from db import databases, get_device_db
+
+    if '--backfill' not in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+    device = sys.argv[sys.argv.index('--device') + 1] if '--device' in sys.argv else None
+    print(f"🔄 Rebuilding rollups for {device or 'all devices'}...")
+    if device:
+        backfill(get_device_db(device), device_id=device)
+    else:
+        # Every shard holds its own devices' raw rows and rollups
+        for connect in databases().values():
+            backfill(connect())
+    print("✅ Rollup backfill complete")
@@ -0,0 +1,325 @@
+"""Durable local spool for readings that could not be written to MySQL.
+
+Readings are appended as JSON lines to segment files in INGEST_SPOOL_DIR.
+Appends are fsync'ed in batches (every `fsync_every` records or
+`fsync_interval` seconds), and segments rotate at `segment_bytes`. A
+background replayer memory-maps sealed segments and drains them into
+sensor_readings with multi-row inserts once the database is reachable again,
+checkpointing its byte offset after every batch so a restart resumes where it
+left off.
+
+Only connection-level failures are spooled. A replay batch the database
+rejects on its data (DataError, IntegrityError) is retried row by row, and
+rows that still fail are moved to quarantine.log next to the segments, in
+the segment format, so they stop blocking the rows behind them.
+
+Every process that loads .env (main.py, each gunicorn worker, line_listener.py)
+sees the same INGEST_SPOOL_DIR, so each one claims a worker-N subdirectory with
+an exclusive file lock and spools into and replays only that one. Segment
+names cannot collide and no segment is replayed by two processes; a
+subdirectory left behind by a stopped process is claimed, and drained, by the
+next one to start.
+
+Delivery is at-least-once: a crash between a batch's commit and its checkpoint
+replays that batch. Add the uq_device_ts key from models.sql and set
+DB_INSERT_IGNORE=1 so replayed rows are skipped instead of stored twice.
+"""
+import os
+import json
+import mmap
+import time
+import atexit
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from db import write_readings, is_unavailable
+
+
+def _encode(row):
+    device_id, ldr, water, buzzer, ts = row
+    ts = ts.isoformat() if isinstance(ts, datetime) else ts
+    return (json.dumps([device_id, ldr, water, buzzer, ts], separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _decode(line):
+    device_id, ldr, water, buzzer, ts = json.loads(line)
+    return (device_id, ldr, water, buzzer, datetime.fromisoformat(ts) if ts else None)
+
+
+def _try_lock(f):
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def claim_directory(root):
+    """Lock the first worker-N subdirectory of `root` no live process holds.
+
+    Returns (path, lock file); the lock lasts as long as the file stays open.
+    """
+    index = 0
+    while True:
+        path = os.path.join(root, f"worker-{index}")
+        os.makedirs(path, exist_ok=True)
+        f = open(os.path.join(path, '.lock'), 'a')
+        if _try_lock(f):
+            return path, f
+        f.close()
+        index += 1
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, fsync_every=100,
+                 fsync_interval=0.5, cooldown=5.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.cooldown = cooldown
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._degraded_until = 0.0
+        existing = self._segments()
+        for name in os.listdir(directory):
+            # A crash between removing a replayed segment and its checkpoint leaves the checkpoint
+            # behind; it must not apply to a new segment that reuses the name
+            if name.endswith('.offset') and name[:-len('.offset')] not in existing:
+                os.remove(self._path(name))
+        self._seq = int(existing[-1].split('-')[1].split('.')[0]) + 1 if existing else 1
+        self.stats = {'spooled': 0, 'replayed': 0, 'replay_errors': 0, 'quarantined': 0, 'replay_rate': 0.0}
+
+    def _segments(self):
+        return sorted(n for n in os.listdir(self.directory) if n.startswith('spool-') and n.endswith('.log'))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open_segment(self):
+        name = f"spool-{self._seq:012d}.log"
+        self._seq += 1
+        self._file = open(self._path(name), 'ab')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _seal(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def append(self, rows):
+        """Append (device_id, ldr, water, buzzer, ts) tuples to the active segment."""
+        data = b''.join(_encode(row) for row in rows)
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(data)
+            self._unsynced += len(rows)
+            self.stats['spooled'] += len(rows)
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            if self._file.tell() >= self.segment_bytes:
+                self._seal()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def mark_degraded(self):
+        """Route new writes to the spool for the next `cooldown` seconds."""
+        self._degraded_until = time.monotonic() + self.cooldown
+
+    def is_degraded(self):
+        return time.monotonic() < self._degraded_until
+
+    def _offset(self, name):
+        try:
+            with open(self._path(name) + '.offset') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _checkpoint(self, name, offset):
+        tmp = self._path(name) + '.offset.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp, self._path(name) + '.offset')
+
+    def depth_bytes(self):
+        """Bytes of spooled data not yet replayed."""
+        total = 0
+        for name in self._segments():
+            try:
+                total += os.path.getsize(self._path(name)) - self._offset(name)
+            except OSError:
+                pass
+        return total
+
+    def replay(self, batch_size=1000):
+        """Drain all spooled segments into the database. Returns rows replayed.
+
+        The active segment is sealed first so everything spooled so far is
+        eligible. Raises on database errors; progress up to the last committed
+        batch is checkpointed.
+        """
+        with self._lock:
+            self._seal()
+            names = self._segments()
+        started = time.monotonic()
+        replayed = 0
+        for name in names:
+            replayed += self._replay_segment(name, batch_size)
+        elapsed = time.monotonic() - started
+        if replayed and elapsed > 0:
+            self.stats['replay_rate'] = round(replayed / elapsed, 1)
+        return replayed
+
+    def _write(self, name, batch, pos):
+        """Insert one replay batch and checkpoint past it.
+
+        Raises if the database is unavailable; rows it rejects are quarantined.
+        """
+        try:
+            write_readings(batch)
+        except Exception as e:
+            failed = getattr(e, 'failed_rows', None)
+            if is_unavailable(e):
+                if failed is not None:
+                    # Some shards committed their rows: spool only the rest again and move on past the batch
+                    self.append(failed)
+                    self._checkpoint(name, pos)
+                raise
+            self._isolate(batch if failed is None else failed)
+        self._checkpoint(name, pos)
+
+    def _isolate(self, rows):
+        """Retry a rejected batch one row at a time, quarantining the rows that fail again."""
+        for row in rows:
+            try:
+                write_readings([row])
+            except Exception as e:
+                if is_unavailable(e):
+                    raise
+                self._quarantine(row, e)
+
+    def _quarantine(self, row, error):
+        with self._lock:
+            with open(self._path('quarantine.log'), 'ab') as f:
+                f.write(_encode(row))
+                f.flush()
+                os.fsync(f.fileno())
+            self.stats['quarantined'] += 1
+        print(f"spool replay quarantined a reading from {row[0]}: {error}")
+
+    def _replay_segment(self, name, batch_size):
+        path = self._path(name)
+        offset = self._offset(name)
+        replayed = 0
+        if os.path.getsize(path) > offset:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = offset
+                batch = []
+                while pos < len(mm):
+                    end = mm.find(b'\n', pos)
+                    if end == -1:
+                        break
+                    line = mm[pos:end]
+                    pos = end + 1
+                    try:
+                        batch.append(_decode(line))
+                    except (ValueError, TypeError):
+                        continue
+                    if len(batch) >= batch_size:
+                        self._write(name, batch, pos)
+                        replayed += len(batch)
+                        self.stats['replayed'] += len(batch)
+                        batch = []
+                if batch:
+                    self._write(name, batch, pos)
+                    replayed += len(batch)
+                    self.stats['replayed'] += len(batch)
+        os.remove(path)
+        try:
+            os.remove(path + '.offset')
+        except OSError:
+            pass
+        return replayed
+
+    def info(self):
+        return dict(self.stats, directory=self.directory, depth_bytes=self.depth_bytes(),
+                    segments=len(self._segments()), degraded=self.is_degraded())
+
+    def close(self):
+        with self._lock:
+            self._seal()
+
+
+class SpoolReplayer(threading.Thread):
+    """Background thread that periodically drains the spool into MySQL."""
+
+    def __init__(self, spool, interval=2.0, batch_size=1000):
+        super().__init__(name='spool-replayer', daemon=True)
+        self.spool = spool
+        self.interval = interval
+        self.batch_size = batch_size
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            if not self.spool.depth_bytes():
+                continue
+            try:
+                self.spool.replay(self.batch_size)
+            except Exception as e:
+                self.spool.stats['replay_errors'] += 1
+                if is_unavailable(e):
+                    self.spool.mark_degraded()
+                print(f"spool replay failed, will retry: {e}")
+
+    def stop(self):
+        self._halt.set()
+
+
+spool = None
+spool_lock_file = None
+_spool_lock = threading.Lock()
+
+def get_spool():
+    """Return the shared spool (starting its replayer), or None unless INGEST_SPOOL_DIR is set."""
+    global spool, spool_lock_file
+    directory = os.environ.get('INGEST_SPOOL_DIR')
+    if not directory:
+        return None
+    with _spool_lock:
+        if spool is None:
+            directory, spool_lock_file = claim_directory(directory)
+            spool = Spool(
+                directory,
+                segment_bytes=int(os.environ.get('INGEST_SPOOL_SEGMENT_MB', 16)) * 1024 * 1024,
+                fsync_every=int(os.environ.get('INGEST_SPOOL_FSYNC_EVERY', 100)),
+                fsync_interval=int(os.environ.get('INGEST_SPOOL_FSYNC_MS', 500)) / 1000.0,
+                cooldown=int(os.environ.get('INGEST_SPOOL_COOLDOWN_MS', 5000)) / 1000.0,
+            )
+            atexit.register(spool.close)
+            SpoolReplayer(spool, interval=int(os.environ.get('INGEST_SPOOL_REPLAY_MS', 2000)) / 1000.0).start()
+        return spool
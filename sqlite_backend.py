@@ -0,0 +1,232 @@
+"""
+Embedded SQLite storage backend for single-box edge deployments (DB_BACKEND=sqlite).
+
+get_db() hands out a connection that looks like a mysql-connector one to the
+rest of the code (cursor(dictionary=True), %s placeholders, commit/close), so
+db.py's helpers, main.py and the dashboard run their usual queries against a
+local file with no database server. models_sqlite.sql is applied on first
+connect.
+
+Tuned for ingest:
+  - WAL journaling: readers never block the writer and vice versa
+  - synchronous=NORMAL: fsync at checkpoints rather than every commit (SQLITE_SYNCHRONOUS)
+  - batched transactions: insert_readings() is one executemany and one commit,
+    and transactions start with BEGIN IMMEDIATE so concurrent writers queue on
+    busy_timeout instead of failing on lock upgrade
+  - prepared statements: translated SQL is memoized, so each query text maps to
+    one statement in the connection's compiled-statement cache
+  - a small shared pool (SQLITE_POOL_SIZE) of long-lived connections: Werkzeug
+    serves each request on a new thread, so per-thread connections would be
+    reopened, re-PRAGMA'd and start with an empty statement cache every time
+  - one writer at a time in this process: a connection takes a write lock before
+    its first write statement and drops it on commit/rollback, so writers queue
+    in Python instead of spinning on SQLITE_BUSY
+
+close() hands the connection back to the pool (after rolling back any open
+transaction).
+Rollup bucket expressions (DATE_FORMAT) are translated to strftime, so
+rollups.py --backfill works; retention.py and partitions.py use MySQL-only SQL
+and are not supported on this backend.
+"""
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import rollups
+
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'iot_sensors.db')
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models_sqlite.sql')
+
+
+def _adapt_datetime(ts):
+    # Same shape as MySQL DATETIME: naive UTC, whole seconds, so text order is time order
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.strftime('%Y-%m-%d %H:%M:%S')
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+
+
+@lru_cache(maxsize=256)
+def translate(sql):
+    """Rewrite the MySQL dialect used in this repo into SQLite."""
+    for granularity, fmt in rollups.BUCKET_FORMATS.items():
+        sql = sql.replace(f"DATE_FORMAT(ts, '{fmt}')", f"strftime('{rollups.SQLITE_BUCKET_FORMATS[granularity]}', ts)")
+    return (sql.replace(rollups.MERGE_SQL, rollups.SQLITE_MERGE_SQL)
+               .replace('INSERT IGNORE', 'INSERT OR IGNORE')
+               .replace('%s', '?'))
+
+
+@lru_cache(maxsize=256)
+def _is_write(sql):
+    return not sql.lstrip().upper().startswith(('SELECT', 'PRAGMA'))
+
+
+def _dict_row(cursor, row):
+    return {d[0]: value for d, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    def __init__(self, owner, dictionary=False):
+        self._owner = owner
+        self._cursor = owner._conn.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    def execute(self, sql, params=()):
+        if _is_write(sql):
+            self._owner._begin_write()
+        self._cursor.execute(translate(sql), params)
+
+    def executemany(self, sql, seq_params):
+        if _is_write(sql):
+            self._owner._begin_write()
+        self._cursor.executemany(translate(sql), seq_params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """mysql-connector-shaped wrapper around a sqlite3 connection checked out of the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._writing = False
+
+    def _begin_write(self):
+        if not self._writing:
+            if not self._pool.write_lock.acquire(timeout=self._pool.timeout):
+                raise sqlite3.OperationalError("database is locked (waited for another writer)")
+            self._writing = True
+
+    def _end_write(self):
+        if self._writing:
+            self._writing = False
+            self._pool.write_lock.release()
+
+    def cursor(self, dictionary=False, buffered=True):
+        # sqlite3 cursors always step lazily, so every cursor is "unbuffered"
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        finally:
+            self._end_write()
+
+    def rollback(self):
+        try:
+            self._conn.rollback()
+        finally:
+            self._end_write()
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        # Like returning a pooled connection: drop uncommitted work, keep the handle
+        if self._conn is None:
+            return
+        try:
+            if self._conn.in_transaction:
+                self._conn.rollback()
+        finally:
+            self._end_write()
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+def open_connection(path=SQLITE_PATH):
+    conn = sqlite3.connect(path, timeout=5.0, detect_types=sqlite3.PARSE_DECLTYPES,
+                           isolation_level='IMMEDIATE', cached_statements=256,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    conn.execute(f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_MB', 16)) * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class SQLitePool:
+    """Up to `size` sqlite3 connections shared by all threads, opened on demand and kept open."""
+
+    def __init__(self, path=SQLITE_PATH, size=4, timeout=5.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.write_lock = threading.Lock()
+        self._idle = []
+        self._opened = 0
+        self._schema_ready = False
+        self._cond = threading.Condition()
+
+    def _open(self):
+        conn = open_connection(self.path)
+        with self._cond:
+            if not self._schema_ready:
+                with open(SCHEMA_FILE) as f:
+                    conn.executescript(f.read())
+                self._schema_ready = True
+        return conn
+
+    def connection(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(f"SQLite connection pool exhausted ({self.size} in use)")
+                self._cond.wait(remaining)
+            if self._idle:
+                return SQLiteConnection(self, self._idle.pop())
+            self._opened += 1
+        try:
+            return SQLiteConnection(self, self._open())
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+
+pool = None
+_pool_lock = threading.Lock()
+
+def connect():
+    """A connection from the shared pool (the first one applies the schema)."""
+    global pool
+    if pool is None:
+        with _pool_lock:
+            if pool is None:
+                pool = SQLitePool(SQLITE_PATH, size=int(os.environ.get('SQLITE_POOL_SIZE', 4)))
+    return pool.connection()
@@ -1,97 +1,522 @@
 
+import io
 import csv
 import os
+import json
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from db import get_db, init_pool
+import numpy as np
+import pandas as pd
+from db import get_device_db, get_shard_router, init_pool, INSERT_SQL
+import rollups
 
-def parse_csv_row(row, base_timestamp=None):
+# LightStatus -> approximate LDR reading (DAY/NIGHT or TERANG/GELAP); anything else is 500
+DARK = ['NIGHT', 'GELAP', 'MALAM']
+BRIGHT = ['DAY', 'TERANG', 'SIANG']
+NUMERIC_COLUMNS = ['Time(s)', 'WaterLevel', 'LED', 'Buzzer']
+
+
+def convert_block(block, fieldnames, delimiter, base_timestamp, device_id):
     """
-    Parse CSV row and convert to database format
+    Convert a block of CSV lines to insert tuples in one columnar pass
     CSV columns: Time(s);WaterLevel;LightStatus;Status;LED;Buzzer
+    
+    Returns (values, bad) where `bad` holds the 0-based indexes (among the
+    block's non-blank lines) of rows with a missing or non-integer numeric field.
+    """
+    if not block.strip():
+        return [], []
+    # The C parser types clean numeric columns directly; LightStatus only needs mapping per distinct value
+    frame = pd.read_csv(io.BytesIO(block), sep=delimiter, header=None, names=fieldnames,
+                        usecols=range(len(fieldnames)), dtype={'LightStatus': 'category', 'Status': 'category'},
+                        skipinitialspace=True, low_memory=False, engine='c')
+    numbers = {}
+    bad = np.zeros(len(frame), dtype=bool)
+    for column in NUMERIC_COLUMNS:
+        number = frame[column]
+        if number.dtype.kind not in 'iu':
+            # Blank, fractional or non-numeric fields: only blocks that contain them take this path
+            number = pd.to_numeric(number, errors='coerce').to_numpy(dtype=float)
+            bad |= np.isnan(number) | (number % 1 != 0)
+        numbers[column] = np.asarray(number)
+    ok = ~bad
+    
+    # Map to database schema: LDR approximated from LightStatus, looked up by category code
+    light = frame['LightStatus'].cat
+    labels = light.categories.str.strip().str.upper()
+    ldr_by_code = np.append(np.select([labels.isin(DARK), labels.isin(BRIGHT)], [200, 800], 500), 500)
+    ldr = ldr_by_code[light.codes.to_numpy()[ok]]  # code -1 (blank) picks the trailing default
+    water = (numbers['WaterLevel'][ok] > 0).astype(np.int64)
+    buzzer = numbers['Buzzer'][ok].astype(np.int64)
+    
+    # Timestamps are offsets of Time(s) from the base (or back from now without one)
+    offsets = numbers['Time(s)'][ok].astype(np.int64).astype('timedelta64[s]')
+    # Whole seconds, like the ingest path: DATETIME would round any fraction into the next second
+    if base_timestamp:
+        ts = np.datetime64(base_timestamp, 's') + offsets
+    else:
+        ts = np.datetime64(datetime.utcnow(), 's') - offsets
+    
+    values = list(zip([device_id] * len(ldr), ldr.tolist(), water.tolist(), buzzer.tolist(),
+                      ts.astype('datetime64[us]').astype(object).tolist()))
+    return values, np.flatnonzero(bad).tolist()
+
+def _init_db():
+    """Open the primary pool up front; with DB_SHARDS, shard pools connect on first use instead."""
+    if get_shard_router() is None:
+        init_pool()
+
+
+def detect_delimiter(csv_file):
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        sample = f.read(1024)
+    return ';' if ';' in sample else ','
+
+
+def read_header(csv_file, delimiter):
+    """Column names and the byte offset where the data rows start."""
+    with open(csv_file, 'rb') as f:
+        line = f.readline()
+        return next(csv.reader([line.decode('utf-8')], delimiter=delimiter), []), f.tell()
+
+
+def read_last_row(csv_file, delimiter, block=4096):
+    """Last non-empty data row, found by reading backwards from the end (None if there is none)."""
+    fieldnames, data_start = read_header(csv_file, delimiter)
+    with open(csv_file, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while True:
+            start = max(data_start, end - block)
+            f.seek(start)
+            lines = [line for line in f.read(end - start).splitlines() if line.strip()]
+            # Unless we reached the first data row, lines[0] may be cut in half
+            if len(lines) >= 2 or start == data_start:
+                break
+            block *= 4
+    if not lines:
+        return None
+    return dict(zip(fieldnames, next(csv.reader([lines[-1].decode('utf-8')], delimiter=delimiter))))
+
+
+def read_blocks(csv_file, start=None, end=None, block_bytes=1 << 20, data_start=None, complete_only=False):
+    """Stage 1: yield (block of whole lines, byte offset just past it), about `block_bytes` at a time.
+
+    `start` resumes from a byte offset at a row boundary (default: first data row);
+    reading stops at the first row boundary at or after `end`. With
+    `complete_only`, a final line without its newline (still being written) is
+    left for the next read.
     """
+    with open(csv_file, 'rb') as f:
+        if data_start is None:
+            f.readline()
+            data_start = f.tell()
+        position = f.seek(data_start if start is None else max(start, data_start))
+        while end is None or position < end:
+            size = block_bytes if end is None else min(block_bytes, end - position)
+            block = f.read(size)
+            if not block:
+                return
+            if not block.endswith(b'\n'):
+                # Complete the last line (at end of file it simply has no newline)
+                block += f.readline()
+            if complete_only and not block.endswith(b'\n'):
+                block = block[:block.rfind(b'\n') + 1]
+                if not block:
+                    return
+                position += len(block)
+                yield block, position
+                return
+            position += len(block)
+            yield block, position
+
+
+def parse_blocks(blocks, fieldnames, delimiter, base_timestamp, device_id, counts):
+    """Stage 2: convert blocks to insert tuples, yielding (values, byte offset after its block).
+
+    counts['rows'] / counts['errors'] are updated in place and counts['bad_rows']
+    collects the 1-based data row numbers of rows that failed to convert.
+    """
+    for block, position in blocks:
+        values, bad = convert_block(block, fieldnames, delimiter, base_timestamp, device_id)
+        first_row = counts['rows'] + 1
+        counts['rows'] += len(values) + len(bad)
+        counts['errors'] += len(bad)
+        counts['bad_rows'].extend(first_row + i for i in bad)
+        for row in values:
+            yield row, position
+
+
+def batch_rows(records, batch_size):
+    """Stage 3: group parsed records into lists of `batch_size` (values, byte offset after the last one)."""
+    batch = []
+    for values, position in records:
+        batch.append(values)
+        if len(batch) >= batch_size:
+            yield batch, position
+            batch = []
+    if batch:
+        yield batch, position
+
+
+def insert_batch(values):
+    """Stage 4: one executemany + commit for a batch (on the device's shard). Returns rows inserted."""
+    conn = get_device_db(values[0][0])
+    cursor = conn.cursor()
     try:
-        time_sec = int(row['Time(s)'])
-        water_level = int(row['WaterLevel'])
-        light_status = row['LightStatus'].strip().upper()
-        status = row['Status'].strip().upper()
-        
-        # LED and Buzzer are already numeric (1/0) in your CSV
-        led = int(row['LED'].strip())
-        buzzer = int(row['Buzzer'].strip())
-        
-        # Generate timestamp based on Time(s) offset
-        if base_timestamp:
-            ts = base_timestamp + timedelta(seconds=time_sec)
-        else:
-            ts = datetime.utcnow() - timedelta(seconds=time_sec)
-        
-        # Map to database schema
-        # LDR approximated from LightStatus (DAY/NIGHT or TERANG/GELAP)
-        if light_status in ['NIGHT', 'GELAP', 'MALAM']:
-            ldr_value = 200  # Low light
-        elif light_status in ['DAY', 'TERANG', 'SIANG']:
-            ldr_value = 800  # Bright light
-        else:
-            ldr_value = 500  # Default/unknown
-        
-        # Water sensor (1=detected, 0=not detected) based on water level or status
-        if water_level > 0:
-            water_detected = 1
-        else:
-            water_detected = 0
-        
-        return {
-            'device_id': 'csv_import',
-            'ldr': ldr_value,
-            'water': water_detected,
-            'buzzer': buzzer,
-            'ts': ts,
-            'water_level': water_level,  # Extra field for reference
-            'status': status  # Extra field for reference
-        }
-    except Exception as e:
-        print(f"❌ Error parsing row: {row}")
-        print(f"   Error details: {e}")
+        cursor.executemany(INSERT_SQL, values)
+        inserted = cursor.rowcount  # before rollups.apply, which runs its own statements on this cursor
+        if rollups.enabled():
+            rollups.apply(cursor, values, inserted=inserted)
+        conn.commit()
+        return inserted
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def split_ranges(csv_file, parts, data_start, size=None):
+    """Cut the data rows (up to byte `size`, default the whole file) into about `parts` (start, end) byte ranges
+    that begin at row boundaries."""
+    size = size or os.path.getsize(csv_file)
+    bounds = [data_start]
+    with open(csv_file, 'rb') as f:
+        for k in range(1, parts):
+            target = data_start + (size - data_start) * k // parts
+            if target <= bounds[-1]:
+                continue
+            # Finish the row that straddles `target`; if target - 1 is a newline, target is a row start
+            f.seek(target - 1)
+            f.readline()
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _insert_batches(batches, commit_every, device_id):
+    """executemany each batch over one pooled connection, committing every `commit_every` batches.
+
+    Returns the rows actually written, which with DB_INSERT_IGNORE=1 excludes skipped duplicates.
+    """
+    conn = get_device_db(device_id)
+    cursor = conn.cursor()
+    inserted = 0
+    try:
+        for n, batch in enumerate(batches, 1):
+            cursor.executemany(INSERT_SQL, batch)
+            written = cursor.rowcount
+            if rollups.enabled():
+                rollups.apply(cursor, batch, inserted=written)
+            inserted += written
+            if n % commit_every == 0:
+                conn.commit()
+        conn.commit()
+        return inserted
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _null(value):
+    return '\\N' if value is None else value
+
+
+def _load_data_infile(batches, device_id):
+    """Write the rows to a temp file and bulk-load it with LOAD DATA LOCAL INFILE in one transaction.
+
+    Returns the rows loaded; LOCAL skips rows that hit a duplicate key.
+    """
+    import tempfile
+    import mysql.connector
+    from db import DB_CONFIG
+
+    router = get_shard_router()
+    config = router.pools[router.shard_for(device_id)].config if router is not None else DB_CONFIG
+    conn = mysql.connector.connect(allow_local_infile=True, **config)
+    cursor = conn.cursor()
+    inserted = 0
+    spans = {}
+    path = None
+    try:
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, encoding='utf-8', newline='') as tmp:
+            path = tmp.name
+            for batch in batches:
+                for device, ldr, water, buzzer, ts in batch:
+                    tmp.write(f"{device}\t{_null(ldr)}\t{_null(water)}\t{_null(buzzer)}\t{ts:%Y-%m-%d %H:%M:%S}\n")
+                if rollups.enabled():
+                    # Same transaction as the LOAD DATA below
+                    rollups.apply(cursor, batch)
+                    rollups.spans(batch, spans)
+                inserted += len(batch)
+        cursor.execute(
+            "LOAD DATA LOCAL INFILE %s INTO TABLE sensor_readings "
+            "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (device_id, ldr, water, buzzer, ts)",
+            (path,)
+        )
+        loaded = cursor.rowcount
+        if rollups.enabled() and loaded < inserted:
+            # LOCAL skips duplicate keys: the merged counts include them, so rebuild the loaded span from raw rows
+            for sql, params in rollups.rebuild_statements(spans):
+                cursor.execute(sql, params)
+        conn.commit()
+        return loaded
+    finally:
+        cursor.close()
+        conn.close()
+        if path:
+            os.remove(path)
+
+
+def load_range(csv_file, delimiter, start, end, base_timestamp, device_id, batch_size, commit_every, load_data):
+    """Process-pool worker: parse one byte range and insert it.
+
+    Returns (rows read, inserted, bad row numbers counted from the start of the range).
+    """
+    fieldnames, data_start = read_header(csv_file, delimiter)
+    counts = {'rows': 0, 'errors': 0, 'bad_rows': []}
+    records = parse_blocks(read_blocks(csv_file, start, end, data_start=data_start),
+                           fieldnames, delimiter, base_timestamp, device_id, counts)
+    batches = (batch for batch, _ in batch_rows(records, batch_size))
+    inserted = (_load_data_infile(batches, device_id) if load_data
+                else _insert_batches(batches, commit_every, device_id))
+    return counts['rows'], inserted, counts['bad_rows']
+
+
+def parallel_load(csv_file, delimiter, base_timestamp, device_id, workers, batch_size, commit_every, load_data,
+                  size=None):
+    """Parse and insert byte ranges of the file in `workers` processes, each on its own connection.
+
+    Returns (rows read, inserted, bad rows, failed ranges). A failed range is
+    reported and the rest continue; with commit_every > 1 part of it may already
+    be committed.
+    """
+    _, data_start = read_header(csv_file, delimiter)
+    # A few ranges per worker so one slow range does not leave the others idle
+    ranges = split_ranges(csv_file, workers * 4, data_start, size)
+    total_bytes = (size or os.path.getsize(csv_file)) - data_start
+    rows = inserted = failed = done_bytes = 0
+    bad_rows = []
+    # spawn, not fork: children must not inherit the parent's open DB sockets
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(load_range, csv_file, delimiter, start, end, base_timestamp, device_id,
+                               batch_size, commit_every, load_data): (start, end)
+                   for start, end in ranges}
+        for future in as_completed(futures):
+            start, end = futures[future]
+            try:
+                r, i, bad = future.result()
+                rows += r
+                inserted += i
+                bad_rows.extend(f"{n} (range @{start})" for n in bad)
+            except Exception as e:
+                failed += 1
+                print(f"\n❌ Error loading bytes {start}-{end}: {e}")
+            done_bytes += end - start
+            progress = done_bytes / total_bytes * 100 if total_bytes else 100.0
+            print(f"  Progress: {progress:.1f}% ({done_bytes:,}/{total_bytes:,} bytes, {inserted} records)", end='\r')
+    return rows, inserted, bad_rows, failed
+
+
+def file_identity(csv_file):
+    """Device/inode plus a hash of the header line: changes when the file is replaced or rotated."""
+    st = os.stat(csv_file)
+    with open(csv_file, 'rb') as f:
+        header = f.readline()
+    return {'dev': st.st_dev, 'inode': st.st_ino, 'header': hashlib.sha1(header).hexdigest()}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
         return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def row_boundary(csv_file, offset):
+    """First row start at or after byte `offset` (end of file if the last row has no newline)."""
+    with open(csv_file, 'rb') as f:
+        f.seek(max(offset - 1, 0))
+        f.readline()
+        return f.tell()
 
-def upload_csv_to_db(csv_file='sensorWater.csv', device_id='csv_import', batch_size=100, clear_existing=False):
+
+def _checkpoint_state(csv_file, device_id, offset, base_timestamp, last_time=None, rows=0, bad_rows=0):
+    return {'identity': file_identity(csv_file), 'device_id': device_id, 'offset': offset,
+            'base_timestamp': base_timestamp.isoformat(), 'last_time': last_time, 'rows': rows, 'bad_rows': bad_rows}
+
+
+def _fresh_checkpoint(csv_file, delimiter, device_id):
+    last_row = read_last_row(csv_file, delimiter)
+    try:
+        # Same anchoring as a full upload: the newest existing row lands at "now"
+        base_timestamp = datetime.utcnow() - timedelta(seconds=int(last_row['Time(s)']))
+    except Exception:
+        base_timestamp = datetime.utcnow()
+    return _checkpoint_state(csv_file, device_id, read_header(csv_file, delimiter)[1], base_timestamp)
+
+
+def clear_device(device_id):
+    """Delete every stored reading of device_id. Returns rows deleted."""
+    conn = get_device_db(device_id)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM sensor_readings WHERE device_id = %s", (device_id,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _valid_checkpoint(state, csv_file, device_id):
+    if state is None:
+        return False
+    if state.get('device_id') != device_id or state.get('identity') != file_identity(csv_file):
+        print("⚠️  Checkpoint belongs to another file or device; starting from the beginning")
+        return False
+    if os.path.getsize(csv_file) < state['offset']:
+        print("⚠️  File is shorter than the checkpoint (truncated?); starting from the beginning")
+        return False
+    return True
+
+
+def import_new_rows(csv_file, delimiter, state, checkpoint_path, batch_size):
+    """Insert the complete rows after state['offset'], one transaction and checkpoint per block.
+
+    Returns rows inserted. A crash between a commit and its checkpoint re-imports
+    that block on the next run; use the uq_device_ts key with DB_INSERT_IGNORE=1
+    to make that harmless.
+    """
+    fieldnames, data_start = read_header(csv_file, delimiter)
+    base_timestamp = datetime.fromisoformat(state['base_timestamp'])
+    inserted = 0
+    for block, position in read_blocks(csv_file, start=state['offset'], data_start=data_start, complete_only=True):
+        values, bad = convert_block(block, fieldnames, delimiter, base_timestamp, state['device_id'])
+        if values:
+            batches = (values[i:i + batch_size] for i in range(0, len(values), batch_size))
+            inserted += _insert_batches(batches, commit_every=len(values), device_id=state['device_id'])
+            state['last_time'] = int((values[-1][4] - base_timestamp).total_seconds())
+        if bad:
+            print(f"⚠️  Skipped {len(bad)} unparseable rows before byte {position}")
+        state['offset'] = position
+        state['rows'] += len(values)
+        state['bad_rows'] += len(bad)
+        save_checkpoint(checkpoint_path, state)
+    return inserted
+
+
+def incremental_upload(csv_file='sensorWater.csv', device_id='csv_import', batch_size=1000,
+                       checkpoint_path=None, follow=False, interval=1.0, clear_existing=False):
+    """
+    Import only rows appended since the last run, tracked in a checkpoint file
+    (byte offset, last Time(s), file identity, base timestamp).
+    
+    With `follow`, keep tailing the file and insert new lines every `interval`
+    seconds until interrupted. A replaced or truncated file restarts from its first row.
+    With `clear_existing`, the device's rows are deleted and the import starts over.
+    """
+    if not os.path.exists(csv_file):
+        print(f"❌ Error: CSV file '{csv_file}' not found!")
+        return False
+    checkpoint_path = checkpoint_path or csv_file + '.checkpoint'
+    delimiter = detect_delimiter(csv_file)
+    
+    try:
+        _init_db()
+    except Exception as e:
+        print(f"❌ Failed to initialize database connection: {e}")
+        return False
+    
+    if clear_existing:
+        try:
+            print(f"🗑️  Deleted {clear_device(device_id)} existing records for device '{device_id}'")
+        except Exception as e:
+            print(f"❌ Error clearing existing data: {e}")
+            return False
+        state = None
+    else:
+        state = load_checkpoint(checkpoint_path)
+    if _valid_checkpoint(state, csv_file, device_id):
+        print(f"📌 Resuming {csv_file} at byte {state['offset']:,} (last Time(s): {state['last_time']})")
+    else:
+        state = _fresh_checkpoint(csv_file, delimiter, device_id)
+        save_checkpoint(checkpoint_path, state)
+    
+    total = 0
+    try:
+        while True:
+            try:
+                inserted = import_new_rows(csv_file, delimiter, state, checkpoint_path, batch_size)
+            except Exception as e:
+                if not follow:
+                    print(f"❌ Error importing new rows: {e}")
+                    return False
+                # Nothing past the last checkpoint is lost; retry on the next poll
+                print(f"❌ Error importing new rows (retrying): {e}")
+                inserted = 0
+            total += inserted
+            if inserted:
+                print(f"  ➕ {inserted} new rows (offset {state['offset']:,}, Time(s) {state['last_time']})")
+            if not follow:
+                break
+            time.sleep(interval)
+            if not _valid_checkpoint(state, csv_file, device_id):
+                state = _fresh_checkpoint(csv_file, delimiter, device_id)
+                save_checkpoint(checkpoint_path, state)
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopped following")
+    
+    print(f"✅ Imported {total} new rows; checkpoint at byte {state['offset']:,} ({checkpoint_path})")
+    return True
+
+
+def upload_csv_to_db(csv_file='sensorWater.csv', device_id='csv_import', batch_size=100, clear_existing=False,
+                     workers=1, commit_every=1, load_data=False, checkpoint_path=None):
     """
     Upload CSV data to database
     
+    Rows are streamed through read -> parse -> batch -> insert generators, so
+    memory use does not depend on the file size.
+    
     Args:
         csv_file: Path to CSV file
         device_id: Device identifier for all imported records
         batch_size: Number of records per batch insert
         clear_existing: If True, delete existing records for this device_id first
+        workers: With more than 1, byte ranges of the file are parsed and inserted in that many processes
+        commit_every: Batches per commit in parallel mode
+        load_data: Bulk-load each range with LOAD DATA LOCAL INFILE (MySQL only; implies parallel mode)
+        checkpoint_path: Where a successful upload records how far it read, so a later
+            incremental run continues after it (default: <csv_file>.checkpoint)
     """
     if not os.path.exists(csv_file):
         print(f"❌ Error: CSV file '{csv_file}' not found!")
         return False
     
     print(f"📂 Reading CSV file: {csv_file}")
+    delimiter = detect_delimiter(csv_file)
+    total_bytes = os.path.getsize(csv_file)
+    last_row = read_last_row(csv_file, delimiter)
     
-    # Read CSV file
-    rows = []
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        # Detect delimiter
-        sample = f.read(1024)
-        f.seek(0)
-        delimiter = ';' if ';' in sample else ','
-        
-        reader = csv.DictReader(f, delimiter=delimiter)
-        rows = list(reader)
-    
-    total_rows = len(rows)
-    print(f"📊 Found {total_rows} records in CSV")
-    
-    if total_rows == 0:
+    if last_row is None:
         print("⚠️  No data to upload")
         return False
+    print(f"📊 Streaming {total_bytes:,} bytes of CSV")
     
     # Initialize database pool
     print("🔌 Connecting to database...")
     try:
-        init_pool()
+        _init_db()
         print("✅ Database connection initialized")
     except Exception as e:
         print(f"❌ Failed to initialize database connection: {e}")
@@ -101,93 +526,87 @@ def upload_csv_to_db(csv_file='sensorWater.csv', device_id='csv_import', batch_s
     # Clear existing data if requested
     if clear_existing:
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM sensor_readings WHERE device_id = %s", (device_id,))
-            deleted = cursor.rowcount
-            conn.commit()
-            cursor.close()
-            conn.close()
-            print(f"🗑️  Deleted {deleted} existing records for device '{device_id}'")
+            print(f"🗑️  Deleted {clear_device(device_id)} existing records for device '{device_id}'")
         except Exception as e:
             print(f"❌ Error clearing existing data: {e}")
             return False
     
-    # Parse and insert data
+    # The last row's Time(s) anchors the series at "now"; it is read from the tail of the file
     try:
-        base_timestamp = datetime.utcnow() - timedelta(seconds=int(rows[-1]['Time(s)']))
+        base_timestamp = datetime.utcnow() - timedelta(seconds=int(last_row['Time(s)']))
     except Exception as e:
         print(f"⚠️  Warning: Could not calculate base timestamp: {e}")
         base_timestamp = datetime.utcnow()
     
-    parsed_rows = []
-    
-    print("🔄 Parsing CSV data...")
-    parse_errors = 0
-    for row in rows:
-        parsed = parse_csv_row(row, base_timestamp)
-        if parsed:
-            parsed['device_id'] = device_id
-            parsed_rows.append(parsed)
-        else:
-            parse_errors += 1
-    
-    print(f"✅ Successfully parsed {len(parsed_rows)} records")
-    if parse_errors > 0:
-        print(f"⚠️  Skipped {parse_errors} records due to parse errors")
-    
-    if len(parsed_rows) == 0:
-        print("❌ No valid records to upload after parsing")
-        return False
-    
-    # Batch insert
     success_count = 0
     error_count = 0
+    counts = {'rows': 0, 'errors': 0, 'bad_rows': []}
+    
+    started = time.monotonic()
+    if workers > 1 or load_data:
+        print(f"💾 Parallel upload ({workers} workers, batch size: {batch_size}, commit every {commit_every} batches"
+              f"{', LOAD DATA LOCAL INFILE' if load_data else ''})...")
+        rows, success_count, bad_rows, failed_ranges = parallel_load(
+            csv_file, delimiter, base_timestamp, device_id, max(1, workers), batch_size, commit_every, load_data,
+            size=total_bytes)
+        counts = {'rows': rows, 'errors': len(bad_rows), 'bad_rows': bad_rows}
+        # Rows of a failed range are neither counted as read nor as errors
+        if not failed_ranges:
+            _checkpoint_upload(csv_file, device_id, total_bytes, base_timestamp, last_row, counts, checkpoint_path)
+        return _upload_summary(counts, success_count, error_count, device_id, time.monotonic() - started,
+                               failed_ranges=failed_ranges)
     
     print(f"💾 Uploading to database (batch size: {batch_size})...")
     
-    for i in range(0, len(parsed_rows), batch_size):
-        batch = parsed_rows[i:i+batch_size]
+    fieldnames, data_start = read_header(csv_file, delimiter)
+    records = parse_blocks(read_blocks(csv_file, end=total_bytes, data_start=data_start), fieldnames, delimiter,
+                           base_timestamp, device_id, counts)
+    for batch_number, (batch, position) in enumerate(batch_rows(records, batch_size), 1):
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            
-            # Prepare batch insert
-            sql = """
-                INSERT INTO sensor_readings (device_id, ldr, water, buzzer, ts)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            
-            values = [
-                (row['device_id'], row['ldr'], row['water'], row['buzzer'], row['ts'])
-                for row in batch
-            ]
-            
-            cursor.executemany(sql, values)
-            conn.commit()
-            success_count += cursor.rowcount
-            
-            cursor.close()
-            conn.close()
-            
-            # Progress indicator
-            progress = (i + len(batch)) / len(parsed_rows) * 100
-            print(f"  Progress: {progress:.1f}% ({i + len(batch)}/{len(parsed_rows)})", end='\r')
-            
+            success_count += insert_batch(batch)
         except Exception as e:
             error_count += len(batch)
-            print(f"\n❌ Error inserting batch {i//batch_size + 1}: {e}")
-            print(f"   Batch details: records {i} to {i+len(batch)-1}")
+            print(f"\n❌ Error inserting batch {batch_number}: {e}")
+            print(f"   Batch details: {len(batch)} records ending at byte {position}")
             import traceback
             traceback.print_exc()
             # Continue with next batch instead of stopping
+        
+        # Progress indicator
+        progress = position / total_bytes * 100 if total_bytes else 100.0
+        print(f"  Progress: {progress:.1f}% ({position:,}/{total_bytes:,} bytes, {counts['rows']} records)", end='\r')
+    
+    if not error_count:
+        _checkpoint_upload(csv_file, device_id, total_bytes, base_timestamp, last_row, counts, checkpoint_path)
+    return _upload_summary(counts, success_count, error_count, device_id, time.monotonic() - started)
+
+
+def _checkpoint_upload(csv_file, device_id, end, base_timestamp, last_row, counts, checkpoint_path):
+    """Record a completed full upload so --incremental continues after its last row instead of re-importing."""
+    try:
+        last_time = int(last_row['Time(s)'])
+    except Exception:
+        last_time = None
+    state = _checkpoint_state(csv_file, device_id, row_boundary(csv_file, end), base_timestamp, last_time,
+                              rows=counts['rows'] - counts['errors'], bad_rows=counts['errors'])
+    save_checkpoint(checkpoint_path or csv_file + '.checkpoint', state)
+
+
+def _upload_summary(counts, success_count, error_count, device_id, elapsed, failed_ranges=0):
+    if counts['errors'] > 0:
+        shown = ', '.join(str(n) for n in counts['bad_rows'][:10])
+        more = f" and {counts['errors'] - 10} more" if counts['errors'] > 10 else ""
+        print(f"\n⚠️  Skipped {counts['errors']} records due to parse errors (data rows {shown}{more})")
     
     print(f"\n\n{'='*60}")
     print(f"📈 Upload Summary:")
-    print(f"  Total records in CSV: {total_rows}")
+    print(f"  Total records in CSV: {counts['rows']}")
     print(f"  Successfully uploaded: {success_count}")
     print(f"  Errors: {error_count}")
+    if failed_ranges:
+        print(f"  Failed byte ranges: {failed_ranges} (their rows were not uploaded; rerun to retry)")
     print(f"  Device ID: {device_id}")
+    print(f"  Throughput: {success_count / elapsed if elapsed else 0:,.0f} rows/s ({elapsed:.1f}s)")
     print(f"{'='*60}")
     
     return success_count > 0
@@ -196,7 +615,7 @@ def verify_upload(device_id='csv_import', limit=5):
     """Verify uploaded data by fetching latest records"""
     print(f"\n🔍 Verifying upload - fetching latest {limit} records...")
     try:
-        conn = get_db()
+        conn = get_device_db(device_id)
         cursor = conn.cursor(dictionary=True)
         cursor.execute(
             "SELECT * FROM sensor_readings WHERE device_id = %s ORDER BY ts DESC LIMIT %s",
@@ -224,29 +643,22 @@ def verify_upload(device_id='csv_import', limit=5):
 def get_upload_stats(device_id='csv_import'):
     """Get statistics for uploaded data"""
     try:
-        conn = get_db()
+        conn = get_device_db(device_id)
         cursor = conn.cursor(dictionary=True)
         
-        # Total count
-        cursor.execute(
-            "SELECT COUNT(*) as total FROM sensor_readings WHERE device_id = %s",
-            (device_id,)
-        )
-        total = cursor.fetchone()['total']
-        
-        # Date range
-        cursor.execute(
-            "SELECT MIN(ts) as first_ts, MAX(ts) as last_ts FROM sensor_readings WHERE device_id = %s",
-            (device_id,)
-        )
-        date_range = cursor.fetchone()
-        
-        # Buzzer activations
-        cursor.execute(
-            "SELECT COUNT(*) as buzzer_on FROM sensor_readings WHERE device_id = %s AND buzzer = 1",
-            (device_id,)
-        )
-        buzzer_count = cursor.fetchone()['buzzer_on']
+        if rollups.enabled():
+            # Hourly rollups answer all three questions without scanning raw rows
+            cursor.execute(
+                "SELECT SUM(cnt) as total, MIN(first_ts) as first_ts, MAX(last_ts) as last_ts, "
+                "SUM(buzzer_on) as buzzer_on FROM sensor_rollup_hour WHERE device_id = %s",
+                (device_id,)
+            )
+            summary = cursor.fetchone()
+            total = summary['total'] or 0
+            date_range = summary
+            buzzer_count = summary['buzzer_on'] or 0
+        else:
+            total, date_range, buzzer_count = _raw_upload_stats(cursor, device_id)
         
         cursor.close()
         conn.close()
@@ -259,6 +671,31 @@ def get_upload_stats(device_id='csv_import'):
     except Exception as e:
         print(f"❌ Error fetching stats: {e}")
 
+def _raw_upload_stats(cursor, device_id):
+    """Full-scan COUNT/MIN/MAX over sensor_readings (used when rollups are disabled)"""
+    # Total count
+    cursor.execute(
+        "SELECT COUNT(*) as total FROM sensor_readings WHERE device_id = %s",
+        (device_id,)
+    )
+    total = cursor.fetchone()['total']
+    
+    # Date range
+    cursor.execute(
+        "SELECT MIN(ts) as first_ts, MAX(ts) as last_ts FROM sensor_readings WHERE device_id = %s",
+        (device_id,)
+    )
+    date_range = cursor.fetchone()
+    
+    # Buzzer activations
+    cursor.execute(
+        "SELECT COUNT(*) as buzzer_on FROM sensor_readings WHERE device_id = %s AND buzzer = 1",
+        (device_id,)
+    )
+    buzzer_count = cursor.fetchone()['buzzer_on']
+    
+    return total, date_range, buzzer_count
+
 if __name__ == "__main__":
     import sys
     
@@ -272,17 +709,43 @@ if __name__ == "__main__":
     print("🚀 CSV to Database Uploader")
     print("=" * 60)
     
+    def option(name, default):
+        return int(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+    
     # Check command line arguments
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--clear':
-            CLEAR_EXISTING = True
-            print("⚠️  Mode: CLEAR existing data before upload")
-        elif sys.argv[1] == '--help':
-            print("\nUsage:")
-            print("  python uploadData.py           # Normal upload")
-            print("  python uploadData.py --clear   # Clear existing data first")
-            print("  python uploadData.py --help    # Show this help")
-            sys.exit(0)
+    if '--help' in sys.argv:
+        print("\nUsage:")
+        print("  python uploadData.py           # Normal upload")
+        print("  python uploadData.py --clear   # Clear existing data first")
+        print("  python uploadData.py --workers 8 [--batch-size 5000] [--commit-every 10]")
+        print("                                 # Parallel upload over byte ranges")
+        print("  python uploadData.py --load-data [--workers 8]")
+        print("                                 # Bulk-load ranges with LOAD DATA LOCAL INFILE")
+        print("  python uploadData.py --incremental [--checkpoint FILE] [--clear]")
+        print("                                 # Import only rows appended since the last run (or upload)")
+        print("  python uploadData.py --follow [--interval 1]")
+        print("                                 # Keep tailing the file and import new lines as they arrive")
+        print("  python uploadData.py --help    # Show this help")
+        sys.exit(0)
+    if '--clear' in sys.argv:
+        CLEAR_EXISTING = True
+        print("⚠️  Mode: CLEAR existing data before upload")
+    WORKERS = option('--workers', 1)
+    BATCH_SIZE = option('--batch-size', BATCH_SIZE)
+    COMMIT_EVERY = option('--commit-every', 1)
+    LOAD_DATA = '--load-data' in sys.argv
+    CHECKPOINT = sys.argv[sys.argv.index('--checkpoint') + 1] if '--checkpoint' in sys.argv else CSV_FILE + '.checkpoint'
+    
+    if '--incremental' in sys.argv or '--follow' in sys.argv:
+        interval = float(sys.argv[sys.argv.index('--interval') + 1]) if '--interval' in sys.argv else 1.0
+        if not incremental_upload(csv_file=CSV_FILE, device_id=DEVICE_ID, batch_size=option('--batch-size', 1000),
+                                  checkpoint_path=CHECKPOINT, follow='--follow' in sys.argv, interval=interval,
+                                  clear_existing=CLEAR_EXISTING):
+            sys.exit(1)
+        sys.exit(0)
+    if CLEAR_EXISTING and os.path.exists(CHECKPOINT):
+        # The rows it points past are about to be deleted and re-uploaded
+        os.remove(CHECKPOINT)
     
     try:
         # Upload
@@ -290,7 +753,11 @@ if __name__ == "__main__":
             csv_file=CSV_FILE,
             device_id=DEVICE_ID,
             batch_size=BATCH_SIZE,
-            clear_existing=CLEAR_EXISTING
+            clear_existing=CLEAR_EXISTING,
+            workers=WORKERS,
+            commit_every=COMMIT_EVERY,
+            load_data=LOAD_DATA,
+            checkpoint_path=CHECKPOINT
         )
         
         if success: